@@ -1,28 +1,46 @@
-from flask import Flask, render_template, jsonify, request, redirect, url_for, send_from_directory
+from flask import Flask, Response, render_template, jsonify, request, redirect, url_for, make_response, send_file, send_from_directory, stream_with_context
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import Column, Integer, String, Text, ForeignKey
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, MetaData, TypeDecorator, and_, case, event, func, inspect, or_, select, insert, update, delete
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.schema import CreateTable
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import text 
 from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.utils import secure_filename
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 import os 
-import requests
+import asyncio
+import atexit
+import hashlib
+import hmac
+import io
+import json
+import multiprocessing
+import re
 import shutil 
-from datetime import datetime 
+import threading
+import time
+import uuid
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta 
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from functools import partial, wraps
+from urllib.parse import urlencode
 from apscheduler.schedulers.background import BackgroundScheduler 
+from twilio_client import CircuitBreaker, CircuitOpenError, TwilioClient, TWILIO_API_BASE
+from whatsapp_broadcast import BroadcastSender
 
 # --- NEW PDF IMPORTS ---
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.lib import colors
-import io 
+from invoice_pdf import write_invoice_pdf, render_invoice_pdf_bytes, invoice_pdf_filename, remove_invoice_pdfs
 # --- END NEW PDF IMPORTS ---
 
 # --- 1. INITIALIZATION ---
 app = Flask(__name__)
-CORS(app) 
+CORS(app, expose_headers=['X-Next-Cursor', 'Link', 'ETag', 'Idempotent-Replayed']) 
 app.config['SECRET_KEY'] = 'your_super_secret_key_here' # REQUIRED for Flask-Login sessions
 
 # Configure Database
@@ -39,6 +57,42 @@ WHATSAPP_SENDER = os.environ.get('WHATSAPP_SENDER', 'whatsapp:+14155238886')
 # You MUST replace this with your actual ngrok or production URL when testing file sending.
 PUBLIC_BASE_URL = os.environ.get('PUBLIC_BASE_URL', "https://ngrok.com/r/http-request")
 
+# Twilio posts delivery updates here; it signs them for exactly this URL
+TWILIO_STATUS_CALLBACK_URL = os.environ.get('TWILIO_STATUS_CALLBACK_URL', f"{PUBLIC_BASE_URL}/api/twilio/status")
+
+# Stops calls to Twilio while it is failing or slow; shared by the outbox and broadcasts
+twilio_breaker = CircuitBreaker(
+    failure_rate=float(os.environ.get('TWILIO_BREAKER_FAILURE_RATE', 0.5)),
+    slow_call_seconds=float(os.environ.get('TWILIO_BREAKER_SLOW_CALL_SECONDS', 5)),
+    slow_call_rate=float(os.environ.get('TWILIO_BREAKER_SLOW_CALL_RATE', 0.5)),
+    window=int(os.environ.get('TWILIO_BREAKER_WINDOW', 20)),
+    min_calls=int(os.environ.get('TWILIO_BREAKER_MIN_CALLS', 5)),
+    open_seconds=float(os.environ.get('TWILIO_BREAKER_OPEN_SECONDS', 30)),
+    probes=int(os.environ.get('TWILIO_BREAKER_PROBES', 3)),
+)
+
+# Shared, keep-alive Twilio client (credentials are read once, here)
+twilio_client = TwilioClient(
+    TWILIO_ACCOUNT_SID,
+    TWILIO_AUTH_TOKEN,
+    WHATSAPP_SENDER,
+    base_url=os.environ.get('TWILIO_API_BASE', TWILIO_API_BASE),
+    status_callback=TWILIO_STATUS_CALLBACK_URL,
+    timeout=(float(os.environ.get('TWILIO_CONNECT_TIMEOUT', 5)), float(os.environ.get('TWILIO_READ_TIMEOUT', 30))),
+    max_retries=int(os.environ.get('TWILIO_MAX_RETRIES', 3)),
+    breaker=twilio_breaker,
+)
+
+# --- SIGNED MEDIA URLS ---
+# Links handed to Twilio carry an HMAC signature and expiry instead of relying on a session.
+MEDIA_URL_SECRET = os.environ.get('MEDIA_URL_SECRET', app.config['SECRET_KEY'])
+MEDIA_URL_TTL = int(os.environ.get('MEDIA_URL_TTL_SECONDS', 3600))
+# Let the front-end server send media files: '' (Flask sends them), 'x-sendfile' (Apache,
+# lighttpd) or 'x-accel-redirect' (nginx, with an internal location at MEDIA_ACCEL_PREFIX
+# aliased to temp_invoices/)
+MEDIA_SENDFILE = os.environ.get('MEDIA_SENDFILE', '')
+MEDIA_ACCEL_PREFIX = os.environ.get('MEDIA_ACCEL_PREFIX', '/protected_invoices')
+
 
 db = SQLAlchemy(app)
 
@@ -77,7 +131,7 @@ class User(db.Model, UserMixin):
 class Client(db.Model):
     id = Column(Integer, primary_key=True)
     name = Column(String(100), nullable=False)
-    status = Column(String(50), nullable=False)
+    status = Column(String(50), nullable=False, index=True)
     phone = Column(String(50))
 
     def to_dict(self):
@@ -92,8 +146,8 @@ class Task(db.Model):
     id = Column(Integer, primary_key=True)
     name = Column(Text, nullable=False)
     due_date = Column(String(50), nullable=False)
-    priority = Column(String(50), nullable=False)
-    assigned_to = Column(String(50))
+    priority = Column(String(50), nullable=False, index=True)
+    assigned_to = Column(String(50), index=True)
 
     def to_dict(self):
         return {
@@ -106,18 +160,45 @@ class Task(db.Model):
 
 # --- NEW BILLING MODELS ---
 
+CENT = Decimal('0.01')
+
+
+def to_money(amount):
+    """Rounds an amount to whole cents, e.g. Decimal('12.505') -> Decimal('12.51')."""
+    return Decimal(str(amount)).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+class Money(TypeDecorator):
+    """
+    Stores money as integer cents so the database can SUM it exactly.
+    Python code sees Decimal amounts with two places, which serialize to JSON as '12.50'.
+    """
+    impl = Integer
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return int(to_money(value) * 100)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return (Decimal(value) / 100).quantize(CENT)
+
+
 class Invoice(db.Model):
     id = Column(Integer, primary_key=True)
     invoice_number = Column(String(50), unique=True, nullable=False)
-    issue_date = Column(String(50), nullable=False)
+    issue_date = Column(String(50), nullable=False, index=True)
     due_date = Column(String(50))
-    total_amount = Column(String(50), default='0.00')
-    status = Column(String(20), default='Draft') 
+    total_amount = Column(Money, default=Decimal('0.00'))
+    status = Column(String(20), default='Draft', index=True) 
 
-    client_id = Column(Integer, ForeignKey('client.id'), nullable=False)
+    client_id = Column(Integer, ForeignKey('client.id'), nullable=False, index=True)
     client = relationship("Client", backref=db.backref('invoices', lazy=True))
     
-    line_items = relationship("LineItem", backref='invoice', lazy=True, cascade="all, delete-orphan")
+    line_items = relationship("LineItem", backref='invoice', lazy=True, cascade="all, delete-orphan", order_by="LineItem.id")
 
     def to_dict(self):
         return {
@@ -136,10 +217,10 @@ class LineItem(db.Model):
     id = Column(Integer, primary_key=True)
     description = Column(Text, nullable=False)
     quantity = Column(Integer, nullable=False)
-    unit_price = Column(String(50), nullable=False)
-    subtotal = Column(String(50), nullable=False)
+    unit_price = Column(Money, nullable=False)
+    subtotal = Column(Money, nullable=False)
 
-    invoice_id = Column(Integer, ForeignKey('invoice.id'), nullable=False)
+    invoice_id = Column(Integer, ForeignKey('invoice.id'), nullable=False, index=True)
 
     def to_dict(self):
         return {
@@ -150,64 +231,730 @@ class LineItem(db.Model):
             'subtotal': self.subtotal
         }
 
+# --- DASHBOARD COUNTERS ---
+# /api/stats reads pre-computed counters instead of running COUNT(*) over every table.
+# The counters are adjusted inside the same transaction as the rows they describe.
+
+OUTSTANDING_INVOICE_STATUSES = ('Draft', 'Sent', 'Delivered', 'Read')
+
+STAT_COUNTER_NAMES = (
+    'total_clients',
+    'pending_clients',
+    'total_tasks',
+    'high_priority_tasks',
+    'total_invoices',
+    'outstanding_invoices',
+)
+
+
+class StatCounter(db.Model):
+    name = Column(String(50), primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
+
+
+def stat_contributions(model, values):
+    """
+    Returns how much one row of `model` with the given column values adds to each counter.
+    `values` maps column names to values, so it works for ORM objects and raw rows alike.
+    """
+    if model is Client:
+        return {
+            'total_clients': 1,
+            'pending_clients': int(values.get('status') == 'Pending'),
+        }
+    if model is Task:
+        return {
+            'total_tasks': 1,
+            'high_priority_tasks': int(values.get('priority') == 'High'),
+        }
+    if model is Invoice:
+        return {
+            'total_invoices': 1,
+            'outstanding_invoices': int((values.get('status') or 'Draft') in OUTSTANDING_INVOICE_STATUSES),
+        }
+    return {}
+
+
+def add_stat_deltas(totals, model, values, sign):
+    """Accumulates the contribution of one row (sign=+1 insert, -1 delete) into totals."""
+    for name, amount in stat_contributions(model, values).items():
+        totals[name] = totals.get(name, 0) + sign * amount
+
+
+def apply_stat_deltas(connection, deltas):
+    """Applies counter deltas with atomic 'value = value + delta' updates."""
+    for name, delta in deltas.items():
+        if delta:
+            connection.execute(
+                update(StatCounter).where(StatCounter.name == name).values(value=StatCounter.value + delta)
+            )
+
+
+STAT_COLUMNS = {Client: ('status',), Task: ('priority',), Invoice: ('status',)}
+
+
+def _current_values(obj):
+    return {column: getattr(obj, column) for column in STAT_COLUMNS[type(obj)]}
+
+
+def _previous_values(obj):
+    """Column values as they were loaded from the database, before any pending change."""
+    state = inspect(obj)
+    values = {}
+    for column in STAT_COLUMNS[type(obj)]:
+        history = state.attrs[column].history
+        if history.deleted:
+            values[column] = history.deleted[0]
+        elif history.unchanged:
+            values[column] = history.unchanged[0]
+        else:
+            values[column] = getattr(obj, column)
+    return values
+
+
+@event.listens_for(db.session, 'after_flush')
+def update_stat_counters(session, flush_context):
+    """Keeps the dashboard counters in step with every ORM insert, update and delete."""
+    deltas = {}
+    for obj in session.new:
+        if type(obj) in STAT_COLUMNS:
+            add_stat_deltas(deltas, type(obj), _current_values(obj), +1)
+    for obj in session.deleted:
+        if type(obj) in STAT_COLUMNS:
+            add_stat_deltas(deltas, type(obj), _previous_values(obj), -1)
+    for obj in session.dirty:
+        if type(obj) in STAT_COLUMNS and session.is_modified(obj):
+            add_stat_deltas(deltas, type(obj), _previous_values(obj), -1)
+            add_stat_deltas(deltas, type(obj), _current_values(obj), +1)
+    apply_stat_deltas(session.connection(), deltas)
+
+
+def rebuild_stat_counters():
+    """Recomputes every counter from the underlying tables in one aggregated query."""
+    counts = db.session.execute(select(
+        select(func.count(Client.id)).scalar_subquery(),
+        select(func.count(Client.id)).where(Client.status == 'Pending').scalar_subquery(),
+        select(func.count(Task.id)).scalar_subquery(),
+        select(func.count(Task.id)).where(Task.priority == 'High').scalar_subquery(),
+        select(func.count(Invoice.id)).scalar_subquery(),
+        select(func.count(Invoice.id)).where(Invoice.status.in_(OUTSTANDING_INVOICE_STATUSES)).scalar_subquery(),
+    )).one()
+
+    db.session.query(StatCounter).delete()
+    db.session.add_all(StatCounter(name=name, value=value) for name, value in zip(STAT_COUNTER_NAMES, counts))
+    db.session.commit()
+
+
+# --- TABLE CHANGE VERSIONS ---
+# Every table the API lists carries a version number that is bumped in the same
+# transaction as any change to its rows. List endpoints derive their ETag from these
+# versions, so an unchanged collection can be answered with 304 without reading it.
+
+VERSIONED_TABLES = ('client', 'task', 'invoice', 'line_item')
+
+
+class TableVersion(db.Model):
+    name = Column(String(50), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+
+def bump_table_versions(connection, table_names):
+    """Increments the change version of each named table."""
+    if table_names:
+        connection.execute(
+            update(TableVersion)
+            .where(TableVersion.name.in_(sorted(table_names)))
+            .values(version=TableVersion.version + 1)
+        )
+
+
+@event.listens_for(db.session, 'after_flush')
+def record_table_changes(session, flush_context):
+    """Bumps the version of every versioned table touched by this flush."""
+    changed = set()
+    for obj in list(session.new) + list(session.deleted):
+        changed.add(obj.__tablename__)
+    for obj in session.dirty:
+        if session.is_modified(obj):
+            changed.add(obj.__tablename__)
+    bump_table_versions(session.connection(), changed.intersection(VERSIONED_TABLES))
+
+
+def collection_etag(*table_names):
+    """
+    Strong ETag for a collection response: the versions of the tables it is built from
+    plus the query string, since filters and cursors select different representations.
+    """
+    versions = db.session.execute(
+        select(TableVersion.name, TableVersion.version).where(TableVersion.name.in_(table_names))
+    ).all()
+    key = ';'.join(f"{name}:{version}" for name, version in sorted(versions))
+    key += '|' + request.query_string.decode('utf-8')
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def not_modified_response(etag):
+    response = app.response_class(status=304)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+# --- SCHEMA MIGRATIONS ---
+# db.create_all() only creates missing tables; it never changes existing ones. Changes to
+# existing tables are listed here as numbered migrations. Each one runs once per database
+# (recorded in schema_migration) and checks the live schema first, so it is a no-op on a
+# database that create_all() just built from the current models.
+
+class SchemaMigration(db.Model):
+    version = Column(Integer, primary_key=True)
+    name = Column(String(100), nullable=False)
+    applied_at = Column(String(50), nullable=False)
+
+
+def _rebuild_sqlite_table(connection, table, select_columns):
+    """
+    SQLite cannot change a column's type in place, so the table is copied into a new one
+    built from the current model, using `select_columns` (SQL expressions) for the data.
+    """
+    scratch = MetaData()
+    for existing in db.metadata.sorted_tables:
+        existing.to_metadata(scratch)
+    new_table = table.to_metadata(scratch, name=f"{table.name}_new")
+
+    for index in inspect(connection).get_indexes(table.name):
+        connection.execute(text(f'DROP INDEX "{index["name"]}"'))
+    connection.execute(CreateTable(new_table))
+
+    column_names = ', '.join(column.name for column in table.columns)
+    connection.execute(text(
+        f"INSERT INTO {new_table.name} ({column_names}) SELECT {', '.join(select_columns)} FROM {table.name}"
+    ))
+    connection.execute(text(f"DROP TABLE {table.name}"))
+    connection.execute(text(f"ALTER TABLE {new_table.name} RENAME TO {table.name}"))
+    for index in table.indexes:
+        index.create(connection)
+
+
+def migrate_money_to_cents(connection):
+    """Converts the string money columns ('12.50') to integer cents (1250)."""
+    money_columns = {'invoice': ['total_amount'], 'line_item': ['unit_price', 'subtotal']}
+    inspector = inspect(connection)
+
+    for table_name, columns in money_columns.items():
+        if not inspector.has_table(table_name):
+            continue
+        column_types = {column['name']: column['type'] for column in inspector.get_columns(table_name)}
+        if all(isinstance(column_types[name], Integer) for name in columns):
+            continue
+
+        table = db.metadata.tables[table_name]
+        if connection.dialect.name == 'sqlite':
+            select_columns = [
+                f"CAST(ROUND(CAST({column.name} AS REAL) * 100) AS INTEGER)" if column.name in columns else column.name
+                for column in table.columns
+            ]
+            _rebuild_sqlite_table(connection, table, select_columns)
+        else:
+            for name in columns:
+                connection.execute(text(
+                    f"ALTER TABLE {table_name} ALTER COLUMN {name} TYPE INTEGER "
+                    f"USING ROUND(CAST(NULLIF({name}, '') AS NUMERIC) * 100)"
+                ))
+
+
+def _create_missing_indexes(connection, index_names):
+    """Creates the named model indexes that the database does not have yet."""
+    inspector = inspect(connection)
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name in index_names and index.name not in existing:
+                index.create(connection)
+
+
+HOT_COLUMN_INDEXES = (
+    'ix_client_status',
+    'ix_task_priority',
+    'ix_task_assigned_to',
+    'ix_invoice_status',
+    'ix_invoice_client_id',
+    'ix_invoice_issue_date',
+    'ix_line_item_invoice_id',
+)
+
+
+def add_hot_column_indexes(connection):
+    """Indexes the columns that the dashboard, list filters and invoice loading filter on."""
+    _create_missing_indexes(connection, HOT_COLUMN_INDEXES)
+
+
+MIGRATIONS = [
+    (1, 'money_columns_to_integer_cents', migrate_money_to_cents),
+    (2, 'hot_column_indexes', add_hot_column_indexes),
+]
+
+
+def run_migrations():
+    """Applies every migration this database has not recorded yet, in order."""
+    applied = {row.version for row in SchemaMigration.query.all()}
+    for version, name, migration in MIGRATIONS:
+        if version in applied:
+            continue
+        try:
+            migration(db.session.connection())
+            db.session.add(SchemaMigration(version=version, name=name, applied_at=datetime.now().isoformat()))
+            db.session.commit()
+            print(f"--- MIGRATION {version} APPLIED: {name} ---")
+        except Exception:
+            db.session.rollback()
+            print(f"!!! MIGRATION {version} FAILED: {name} !!!")
+            raise
+
 
 # --- NEW FUNCTION: PDF GENERATION ---
+# Rendering lives in invoice_pdf.py. Generated PDFs are cached under a name that includes
+# a hash of everything printed on the invoice, so an unchanged invoice reuses its PDF and
+# any edit produces a new one (the stale copy is dropped when it is replaced).
+#
+# PDF_STORAGE picks where that cache lives:
+#   'disk'   - files under temp_invoices/ (default)
+#   'memory' - rendered straight into a BytesIO and kept in a bounded in-process LRU, for
+#              ephemeral or multi-instance hosts where local files cannot be relied on.
+# A PDF missing from the cache (evicted, or rendered by another instance) is rebuilt from
+# its file name on request, since the name identifies both the invoice and its content.
+#
+# Both stores are bounded: PDFs not served within PDF_CACHE_TTL_HOURS expire, and the least
+# recently served ones are evicted once the store outgrows its size cap. On disk, "last
+# served" is the file's mtime, which is touched whenever the file is served.
+
+PDF_DIR = os.path.join(app.root_path, 'temp_invoices')
+PDF_STORAGE = os.environ.get('PDF_STORAGE', 'disk')
+PDF_MEMORY_CACHE_BYTES = int(os.environ.get('PDF_MEMORY_CACHE_MB', 64)) * 1024 * 1024
+PDF_DISK_CACHE_BYTES = int(os.environ.get('PDF_DISK_CACHE_MB', 512)) * 1024 * 1024
+PDF_CACHE_TTL = int(os.environ.get('PDF_CACHE_TTL_HOURS', 24)) * 3600
+PDF_CACHE_SWEEP_MINUTES = 15
+
+
+class PdfMemoryCache:
+    """Thread-safe LRU of rendered PDFs (file name -> bytes), bounded by total size."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # file name -> (bytes, last served timestamp)
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __contains__(self, filename):
+        with self._lock:
+            return filename in self._entries
+
+    def stats(self):
+        with self._lock:
+            return len(self._entries), self._size
+
+    def get(self, filename):
+        with self._lock:
+            entry = self._entries.get(filename)
+            if entry is None:
+                return None
+            self._entries[filename] = (entry[0], time.time())
+            self._entries.move_to_end(filename)
+            return entry[0]
+
+    def put(self, filename, data):
+        """Adds a PDF; returns the number of entries evicted to make room."""
+        if len(data) > self.max_bytes:
+            return 0
+        evicted = 0
+        with self._lock:
+            if filename in self._entries:
+                self._size -= len(self._entries.pop(filename)[0])
+            self._entries[filename] = (data, time.time())
+            self._size += len(data)
+            while self._size > self.max_bytes:
+                _, (oldest, _) = self._entries.popitem(last=False)
+                self._size -= len(oldest)
+                evicted += 1
+        return evicted
+
+    def expire(self, cutoff):
+        """Drops entries last served before `cutoff`; returns how many were dropped."""
+        expired = 0
+        with self._lock:
+            # Entries are kept in last-served order, so the expired ones are at the front
+            while self._entries:
+                filename, (data, served_at) = next(iter(self._entries.items()))
+                if served_at >= cutoff:
+                    break
+                del self._entries[filename]
+                self._size -= len(data)
+                expired += 1
+        return expired
+
+    def discard_invoice(self, invoice_id, keep=None):
+        """Drops every cached PDF of an invoice, except the one named `keep`."""
+        prefix = f"invoice_{invoice_id}_"
+        with self._lock:
+            for filename in [name for name in self._entries if name.startswith(prefix) and name != keep]:
+                self._size -= len(self._entries.pop(filename)[0])
+
+
+class PdfCacheMetrics:
+    """Hit/miss and eviction counters for the PDF cache of this process."""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.last_sweep = None
+        self._lock = threading.Lock()
+
+    def record_lookup(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def record_removals(self, evicted=0, expired=0):
+        with self._lock:
+            self.evictions += evicted
+            self.expirations += expired
+
+    def to_dict(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'last_sweep': self.last_sweep,
+            }
+
+
+pdf_memory_cache = PdfMemoryCache(PDF_MEMORY_CACHE_BYTES)
+pdf_cache_metrics = PdfCacheMetrics()
+
+
+def touch_cached_pdf(path):
+    """Marks a cached file as just served, so LRU eviction keeps it."""
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def disk_cache_entries():
+    """(last served, size, path) of every file in PDF_DIR, least recently served first."""
+    entries = []
+    try:
+        with os.scandir(PDF_DIR) as scan:
+            for entry in scan:
+                if entry.is_file():
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+    except FileNotFoundError:
+        pass
+    entries.sort()
+    return entries
 
-def generate_invoice_pdf(invoice):
+
+def pdf_cache_usage():
+    """(file count, total bytes) currently held by the configured PDF store."""
+    if PDF_STORAGE == 'memory':
+        return pdf_memory_cache.stats()
+    entries = disk_cache_entries()
+    return len(entries), sum(size for _, size, _ in entries)
+
+
+def sweep_pdf_cache():
     """
-    Generates a PDF file for a given Invoice object.
-    Returns the path to the saved PDF file.
+    Expires PDFs not served within the TTL, then evicts the least recently served ones
+    until the store is back under its size cap. Returns (evicted, expired).
     """
-    PDF_DIR = 'temp_invoices'
-    if not os.path.exists(PDF_DIR):
-        os.makedirs(PDF_DIR)
-        
-    pdf_filename = f"invoice_{invoice.invoice_number}_{invoice.id}.pdf"
-    pdf_path = os.path.join(PDF_DIR, pdf_filename)
-
-    # 1. Setup PDF Document
-    doc = SimpleDocTemplate(pdf_path, pagesize=letter)
-    styles = getSampleStyleSheet()
-    Story = []
-
-    # 2. Header and Client Info
-    Story.append(Paragraph(f"<b>INVOICE #{invoice.invoice_number}</b>", styles['h1']))
-    Story.append(Paragraph(f"<b>Client:</b> {invoice.client.name}", styles['Normal']))
-    Story.append(Paragraph(f"<b>Issue Date:</b> {invoice.issue_date}", styles['Normal']))
-    Story.append(Paragraph(f"<b>Due Date:</b> {invoice.due_date}", styles['Normal']))
-    Story.append(Paragraph(f"<b>Total Due:</b> ${invoice.total_amount}", styles['h2']))
-    Story.append(Paragraph("<br/>", styles['Normal']))
-
-    # 3. Line Items Table Data
-    table_data = [['Description', 'Qty', 'Unit Price', 'Subtotal']]
-    
-    for item in invoice.line_items:
-        table_data.append([
-            item.description,
-            str(item.quantity),
-            f"${item.unit_price}",
-            f"${item.subtotal}"
-        ])
-
-    # Final Total Row
-    table_data.append(['', '', '<b>TOTAL AMOUNT:</b>', f'<b>${invoice.total_amount}</b>'])
-
-    # 4. Create and Style the Table
-    table = Table(table_data, colWidths=[250, 50, 80, 80])
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ('ALIGN', (1, 0), (-1, -1), 'RIGHT'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('BACKGROUND', (0, -1), (-1, -1), colors.yellow), # Highlight total row
-    ]))
-
-    Story.append(table)
-    
-    # 5. Build the PDF
-    doc.build(Story)
-    
-    return pdf_path
+    cutoff = time.time() - PDF_CACHE_TTL
+    evicted = expired = 0
+    if PDF_STORAGE == 'memory':
+        expired = pdf_memory_cache.expire(cutoff)
+    else:
+        entries = disk_cache_entries()
+        total = sum(size for _, size, _ in entries)
+        for served_at, size, path in entries:
+            if served_at >= cutoff and total <= PDF_DISK_CACHE_BYTES:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            if served_at < cutoff:
+                expired += 1
+            else:
+                evicted += 1
+    pdf_cache_metrics.record_removals(evicted, expired)
+    pdf_cache_metrics.last_sweep = datetime.now().isoformat()
+    return evicted, expired
+
+
+def invoice_snapshot(invoice):
+    """Plain, picklable copy of everything printed on the invoice PDF."""
+    return snapshot_from_invoice_dict(invoice.to_dict())
+
+
+def snapshot_from_invoice_dict(data):
+    """Builds the render snapshot from an Invoice.to_dict()-shaped dict."""
+    return {
+        'id': data['id'],
+        'invoice_number': data['invoice_number'],
+        'client_name': data['client_name'],
+        'issue_date': data['issue_date'],
+        'due_date': data['due_date'],
+        'total_amount': str(data['total_amount']),
+        'line_items': [
+            [item['description'], item['quantity'], str(item['unit_price']), str(item['subtotal'])]
+            for item in data['line_items']
+        ],
+    }
+
+
+def is_pdf_cached(filename):
+    if PDF_STORAGE == 'memory':
+        return filename in pdf_memory_cache
+    return os.path.exists(os.path.join(PDF_DIR, filename))
+
+
+def open_cached_pdf(filename):
+    """Binary file object for a cached PDF, or None if it is not (or no longer) cached."""
+    if PDF_STORAGE == 'memory':
+        data = pdf_memory_cache.get(filename)
+        return io.BytesIO(data) if data is not None else None
+    path = os.path.join(PDF_DIR, filename)
+    try:
+        source = open(path, 'rb')
+    except FileNotFoundError:
+        return None
+    touch_cached_pdf(path)
+    return source
+
+
+def discard_invoice_pdfs(invoice_id):
+    if PDF_STORAGE == 'memory':
+        pdf_memory_cache.discard_invoice(invoice_id)
+    else:
+        remove_invoice_pdfs(PDF_DIR, invoice_id)
+
+
+def invoice_pdf_response(filename, download_name=None):
+    """
+    Serves a cached PDF with Content-Length, ETag and HTTP Range support, from memory or
+    from disk depending on PDF_STORAGE. Returns None if the PDF is not cached.
+    """
+    if PDF_STORAGE == 'memory':
+        data = pdf_memory_cache.get(filename)
+        if data is None:
+            return None
+        return pdf_bytes_response(data, filename, download_name)
+    path = os.path.join(PDF_DIR, filename)
+    if not os.path.exists(path):
+        return None
+    touch_cached_pdf(path)
+    return send_from_directory(
+        PDF_DIR,
+        filename,
+        as_attachment=download_name is not None,
+        download_name=download_name,
+        mimetype='application/pdf',
+    )
+
+
+def pdf_bytes_response(data, filename, download_name=None):
+    return send_file(
+        io.BytesIO(data),
+        mimetype='application/pdf',
+        as_attachment=download_name is not None,
+        download_name=download_name or filename,
+        conditional=True,
+        etag=filename,
+    )
+
+
+def rendered_pdf_response(snapshot, result, download_name=None):
+    """
+    Caches a finished render and serves the render result itself rather than looking it up
+    again, so a PDF larger than the memory cache (which is not stored) is still delivered.
+    """
+    filename = store_rendered_pdf(snapshot, result)
+    if PDF_STORAGE == 'memory':
+        return pdf_bytes_response(result, filename, download_name)
+    touch_cached_pdf(result)
+    return send_file(
+        result,
+        mimetype='application/pdf',
+        as_attachment=download_name is not None,
+        download_name=download_name or filename,
+        conditional=True,
+        etag=filename,
+    )
+
+
+# --- PDF RENDER WORKER POOL ---
+# ReportLab builds are CPU bound, so they run in a pool of worker processes instead of
+# inside the request. Each web worker process creates its own pool on first use (never
+# before gunicorn forks), and job state is kept in the database so any web worker can
+# answer a status poll.
+
+PDF_RENDER_WORKERS = int(os.environ.get('PDF_RENDER_WORKERS', os.cpu_count() or 2))
+PDF_RENDER_TIMEOUT = 120  # seconds a request will wait for a render it needs right away
+
+_render_pool = None
+_render_pool_lock = threading.Lock()
+
+
+def get_render_pool():
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is None:
+            # 'spawn' workers import only invoice_pdf, not the web app and its scheduler
+            _render_pool = ProcessPoolExecutor(
+                max_workers=PDF_RENDER_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _render_pool
+
+
+def replace_broken_render_pool(broken):
+    """Drops a pool that lost a worker (e.g. killed for running out of memory); the next use creates a new one."""
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is broken:
+            _render_pool = None
+    broken.shutdown(wait=False, cancel_futures=True)
+    print("!!! PDF RENDER POOL BROKEN: a worker died, starting a new pool !!!")
+
+
+def submit_pdf_render(snapshot):
+    """Starts rendering the snapshot in the worker pool; pass the result to store_rendered_pdf."""
+    if PDF_STORAGE == 'memory':
+        task = (render_invoice_pdf_bytes, snapshot)
+    else:
+        task = (write_invoice_pdf, snapshot, PDF_DIR)
+    pool = get_render_pool()
+    try:
+        return pool.submit(*task)
+    except BrokenProcessPool:
+        replace_broken_render_pool(pool)
+        return get_render_pool().submit(*task)
+
+
+def store_rendered_pdf(snapshot, result):
+    """Records a finished render (PDF bytes or file path) in the cache. Returns the file name."""
+    filename = invoice_pdf_filename(snapshot)
+    if PDF_STORAGE == 'memory':
+        pdf_cache_metrics.record_removals(evicted=pdf_memory_cache.put(filename, result))
+        pdf_memory_cache.discard_invoice(snapshot['id'], keep=filename)
+    return filename
+
+
+def render_invoice_pdf_in_pool(invoice):
+    """Renders the invoice in the worker pool and waits for it. Returns the PDF file name."""
+    return render_snapshot_in_pool(invoice_snapshot(invoice))
+
+
+def render_snapshot_in_pool(snapshot):
+    filename = invoice_pdf_filename(snapshot)
+    cached = is_pdf_cached(filename)
+    pdf_cache_metrics.record_lookup(cached)
+    if cached:
+        return filename
+    return store_rendered_pdf(snapshot, submit_pdf_render(snapshot).result(timeout=PDF_RENDER_TIMEOUT))
+
+
+def render_pdf_from_filename(filename):
+    """
+    Re-renders a PDF that is missing from the cache, given only its file name. Returns
+    (snapshot, render result), or None if it names no invoice or an outdated version of one.
+    """
+    name, extension = os.path.splitext(filename)
+    parts = name.split('_')
+    if extension != '.pdf' or len(parts) != 3 or parts[0] != 'invoice' or not parts[1].isdigit():
+        return None
+    invoice = db.session.get(Invoice, int(parts[1]))
+    if invoice is None:
+        return None
+    snapshot = invoice_snapshot(invoice)
+    if invoice_pdf_filename(snapshot) != filename:
+        return None
+    return snapshot, submit_pdf_render(snapshot).result(timeout=PDF_RENDER_TIMEOUT)
+
+
+class RenderJob(db.Model):
+    id = Column(String(32), primary_key=True)
+    invoice_id = Column(Integer, nullable=False, index=True)
+    status = Column(String(20), nullable=False, default='queued')  # queued, done, failed
+    pdf_filename = Column(String(255))
+    error = Column(Text)
+    created_at = Column(String(50), nullable=False)
+    finished_at = Column(String(50))
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'invoice_id': self.invoice_id,
+            'status': self.status,
+            'error': self.error,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at,
+        }
+
+
+def submit_render_job(invoice):
+    """Queues a background render of the invoice PDF and returns its RenderJob."""
+    snapshot = invoice_snapshot(invoice)
+    job = RenderJob(id=uuid.uuid4().hex, invoice_id=invoice.id, created_at=datetime.now().isoformat())
+
+    filename = invoice_pdf_filename(snapshot)
+    cached = is_pdf_cached(filename)
+    pdf_cache_metrics.record_lookup(cached)
+    if cached:
+        job.status = 'done'
+        job.pdf_filename = filename
+        job.finished_at = job.created_at
+    db.session.add(job)
+    db.session.commit()
+
+    if not cached:
+        try:
+            future = submit_pdf_render(snapshot)
+        except Exception as e:
+            print(f"PDF RENDER JOB {job.id} FAILED: {e}")
+            job.status = 'failed'
+            job.error = str(e)
+            job.finished_at = datetime.now().isoformat()
+            db.session.commit()
+            return job
+        future.add_done_callback(partial(finish_render_job, job.id, snapshot))
+    return job
+
+
+def finish_render_job(job_id, snapshot, future):
+    """Records the outcome of a pool render (runs on the pool's callback thread)."""
+    with app.app_context():
+        job = db.session.get(RenderJob, job_id)
+        try:
+            job.pdf_filename = store_rendered_pdf(snapshot, future.result())
+            job.status = 'done'
+        except Exception as e:
+            print(f"PDF RENDER JOB {job_id} FAILED: {e}")
+            job.status = 'failed'
+            job.error = str(e)
+        job.finished_at = datetime.now().isoformat()
+        db.session.commit()
 
 # --- END PDF GENERATION FUNCTION ---
 
@@ -218,6 +965,7 @@ def initialize_database():
     """Creates tables and populates them with initial data."""
     with app.app_context():
         db.create_all() 
+        run_migrations()
         # ... (unchanged initialization logic) ...
         if User.query.count() == 0:
             admin = User(username='admin', role='admin') 
@@ -242,6 +990,15 @@ def initialize_database():
             ]
             db.session.add_all(initial_tasks)
             db.session.commit()
+
+        if StatCounter.query.count() != len(STAT_COUNTER_NAMES):
+            rebuild_stat_counters()
+
+        existing_versions = {row.name for row in TableVersion.query.all()}
+        missing_versions = [name for name in VERSIONED_TABLES if name not in existing_versions]
+        if missing_versions:
+            db.session.add_all(TableVersion(name=name, version=0) for name in missing_versions)
+            db.session.commit()
         
 
 # --- 4. AUTHENTICATION AND MAIN ROUTES ---
@@ -323,20 +1080,243 @@ def invoices():
 @login_required 
 def serve_invoice_file(filename):
     """
-    Serves the generated PDF files from the temp_invoices directory.
-    This route's path must match the PUBLIC_BASE_URL prefix used in send_invoice_whatsapp.
+    Serves the generated PDF files from the PDF cache (temp_invoices or memory).
     """
-    PDF_DIR = 'temp_invoices'
-    
+    return cached_pdf_response(filename)
+
+
+def cached_pdf_response(filename):
+    """Serves a cached PDF, re-rendering it if it has been evicted; 404 if it names no invoice."""
+    response = invoice_pdf_response(filename)
+    pdf_cache_metrics.record_lookup(response is not None)
+    if response is None:
+        try:
+            rendered = render_pdf_from_filename(filename)
+        except Exception as e:
+            print(f"PDF GENERATION ERROR: {e}")
+            rendered = None
+        if rendered:
+            response = rendered_pdf_response(*rendered)
+    if response is None:
+        return jsonify({"status": "error", "message": "Invoice file not found."}), 404
+    return response
+
+
+# --- SIGNED MEDIA ROUTE ---
+# /media/invoices/<filename>?expires=<unix time>&sig=<hmac> is what Twilio downloads. The
+# signature covers the file name and expiry, so checking it needs neither a session nor a
+# database query; and since PDF file names are content hashes, a link only ever opens the
+# exact invoice version it was issued for.
+
+def media_signature(filename, expires):
+    message = f"{filename}:{expires}".encode('utf-8')
+    return hmac.new(MEDIA_URL_SECRET.encode('utf-8'), message, hashlib.sha256).hexdigest()
+
+
+def signed_media_url(filename, ttl=None):
+    """Public, expiring URL for a cached invoice PDF."""
+    expires = int(time.time()) + (ttl or MEDIA_URL_TTL)
+    # Built by hand rather than with url_for, so the outbox sender can sign URLs outside a request
+    query = urlencode({'expires': expires, 'sig': media_signature(filename, expires)})
+    return f"{PUBLIC_BASE_URL}/media/invoices/{filename}?{query}"
+
+
+def verify_media_signature(filename, expires, signature):
+    try:
+        expires = int(expires)
+    except (TypeError, ValueError):
+        return False
+    if expires < time.time():
+        return False
+    return hmac.compare_digest(media_signature(filename, expires), signature or '')
+
+
+@app.route('/media/invoices/<filename>')
+def serve_signed_media(filename):
+    if not verify_media_signature(filename, request.args.get('expires'), request.args.get('sig')):
+        return jsonify({"status": "error", "message": "Invalid or expired link."}), 403
+
+    filename = secure_filename(filename)
+    path = os.path.join(PDF_DIR, filename)
+    if PDF_STORAGE == 'disk' and MEDIA_SENDFILE and os.path.exists(path):
+        touch_cached_pdf(path)
+        pdf_cache_metrics.record_lookup(True)
+        response = app.response_class(mimetype='application/pdf')
+        if MEDIA_SENDFILE == 'x-accel-redirect':
+            response.headers['X-Accel-Redirect'] = f"{MEDIA_ACCEL_PREFIX}/{filename}"
+        else:
+            response.headers['X-Sendfile'] = path
+        return response
+    # Only a PDF missing from the cache falls through to a database lookup (to re-render it)
+    return cached_pdf_response(filename)
+
+# --- LIST PAGINATION HELPERS ---
+# List endpoints page through rows by primary key (keyset pagination), so the cost of a
+# page does not grow with the size of the table. Pagination is opt-in: requests without
+# 'limit' or 'after' still receive the full list, which keeps the current frontend working.
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+def parse_int_arg(name):
+    """Reads an optional integer query parameter. Raises ValueError on bad input."""
+    value = request.args.get(name)
+    if value is None or value == '':
+        return None
     try:
-        return send_from_directory(
-            PDF_DIR,
-            filename,
-            as_attachment=False, 
-            mimetype='application/pdf'
+        return int(value)
+    except ValueError:
+        raise ValueError(f"Query parameter '{name}' must be an integer.")
+
+
+def paginate_query(query, model):
+    """
+    Applies keyset pagination ('limit' and 'after' query parameters) to a select()
+    and runs it. Returns (rows, next_cursor). next_cursor is None on the last page.
+    """
+    limit = parse_int_arg('limit')
+    after = parse_int_arg('after')
+
+    query = query.order_by(model.id)
+    if limit is None and after is None:
+        return db.session.execute(query).all(), None
+
+    if limit is None:
+        limit = DEFAULT_PAGE_SIZE
+    if limit < 1 or limit > MAX_PAGE_SIZE:
+        raise ValueError(f"'limit' must be between 1 and {MAX_PAGE_SIZE}.")
+
+    if after is not None:
+        query = query.filter(model.id > after)
+
+    # Fetch one extra row to find out whether another page exists
+    rows = db.session.execute(query.limit(limit + 1)).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, rows[-1].id
+    return rows, None
+
+
+def page_response(items, next_cursor, etag=None):
+    """Builds the JSON list response and advertises the next page through headers."""
+    response = jsonify(items)
+    if etag is not None:
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+    if next_cursor is not None:
+        args = request.args.to_dict()
+        args['after'] = next_cursor
+        next_url = url_for(request.endpoint, **request.view_args, **args)
+        response.headers['X-Next-Cursor'] = str(next_cursor)
+        response.headers['Link'] = f'<{next_url}>; rel="next"'
+    return response
+
+
+# --- STREAMING LIST RESPONSES ---
+# With ?stream=1 a list endpoint writes its JSON array incrementally while iterating the
+# result set in server-side batches, so memory stays flat and the first bytes go out
+# immediately. Streaming covers the whole filtered collection ('limit'/'after' are ignored).
+
+STREAM_BATCH_SIZE = 500
+
+
+def wants_stream():
+    return request.args.get('stream', '').lower() in ('1', 'true', 'yes')
+
+
+def stream_query_response(query, model, serialize_rows, etag=None):
+    """Streams every row of `query` as a JSON array, serializing one batch at a time."""
+    dumps = app.json.dumps
+
+    def generate():
+        result = db.session.execute(query.order_by(model.id).execution_options(yield_per=STREAM_BATCH_SIZE))
+        yield '['
+        separator = ''
+        for rows in result.partitions():
+            chunk = ','.join(dumps(item) for item in serialize_rows(rows))
+            if chunk:
+                yield separator + chunk
+                separator = ','
+        yield ']'
+
+    response = app.response_class(stream_with_context(generate()), mimetype='application/json')
+    if etag is not None:
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+# --- FAST READ PATH ---
+# List endpoints select only the columns they return with SQLAlchemy Core and turn each
+# row tuple straight into a dict, skipping ORM instance construction and the identity map.
+# The dicts have the same keys and values as the models' to_dict() methods.
+
+def make_row_serializer(columns):
+    """Builds a function that maps a row tuple onto the keys of the selected columns."""
+    keys = tuple(column.key for column in columns)
+
+    def serialize(row):
+        return dict(zip(keys, row))
+    return serialize
+
+
+CLIENT_COLUMNS = (Client.id, Client.name, Client.status, Client.phone)
+TASK_COLUMNS = (Task.id, Task.name, Task.due_date, Task.priority, Task.assigned_to)
+INVOICE_COLUMNS = (
+    Invoice.id, Invoice.invoice_number, Invoice.client_id, Client.name.label('client_name'),
+    Invoice.issue_date, Invoice.due_date, Invoice.total_amount, Invoice.status,
+)
+LINE_ITEM_COLUMNS = (LineItem.id, LineItem.description, LineItem.quantity, LineItem.unit_price, LineItem.subtotal)
+
+serialize_client_row = make_row_serializer(CLIENT_COLUMNS)
+serialize_task_row = make_row_serializer(TASK_COLUMNS)
+serialize_invoice_row = make_row_serializer(INVOICE_COLUMNS)
+serialize_line_item_row = make_row_serializer(LINE_ITEM_COLUMNS)
+
+
+def client_list_select():
+    return select(*CLIENT_COLUMNS)
+
+
+def task_list_select():
+    return select(*TASK_COLUMNS)
+
+
+def invoice_list_select():
+    return select(*INVOICE_COLUMNS).join(Client, Invoice.client_id == Client.id)
+
+
+def serialize_clients(rows):
+    return [serialize_client_row(row) for row in rows]
+
+
+def serialize_tasks(rows):
+    return [serialize_task_row(row) for row in rows]
+
+
+def serialize_invoice_summaries(rows):
+    """Invoice dicts without line items, for list views."""
+    return [serialize_invoice_row(row) for row in rows]
+
+
+def serialize_invoices(rows):
+    """Invoice dicts with their line items, fetched for the whole batch in one query."""
+    invoices = serialize_invoice_summaries(rows)
+    items_by_invoice = {}
+    for invoice in invoices:
+        invoice['line_items'] = items_by_invoice[invoice['id']] = []
+
+    if items_by_invoice:
+        line_items = db.session.execute(
+            select(LineItem.invoice_id, *LINE_ITEM_COLUMNS)
+            .where(LineItem.invoice_id.in_(list(items_by_invoice)))
+            .order_by(LineItem.id)
         )
-    except FileNotFoundError:
-        return jsonify({"status": "error", "message": "Invoice file not found."}), 404
+        for row in line_items:
+            items_by_invoice[row[0]].append(serialize_line_item_row(row[1:]))
+    return invoices
+
 
 # --- 5. CLIENT CRUD ROUTES ---
 # ... (Client routes remain the same) ...
@@ -345,9 +1325,24 @@ def serve_invoice_file(filename):
 @login_required 
 def handle_clients():
     if request.method == 'GET':
-        clients = Client.query.all()
-        clients_data = [client.to_dict() for client in clients]
-        return jsonify(clients_data)
+        etag = collection_etag('client')
+        if request.if_none_match.contains(etag):
+            return not_modified_response(etag)
+
+        query = client_list_select()
+        status = request.args.get('status')
+        if status:
+            query = query.filter(Client.status == status)
+
+        if wants_stream():
+            return stream_query_response(query, Client, serialize_clients, etag)
+
+        try:
+            clients, next_cursor = paginate_query(query, Client)
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+
+        return page_response(serialize_clients(clients), next_cursor, etag)
 
     elif request.method == 'POST':
         data = request.json
@@ -399,9 +1394,27 @@ def handle_single_client(client_id):
 @login_required 
 def handle_tasks():
     if request.method == 'GET':
-        tasks = Task.query.all()
-        tasks_data = [task.to_dict() for task in tasks]
-        return jsonify(tasks_data)
+        etag = collection_etag('task')
+        if request.if_none_match.contains(etag):
+            return not_modified_response(etag)
+
+        query = task_list_select()
+        priority = request.args.get('priority')
+        if priority:
+            query = query.filter(Task.priority == priority)
+        assigned_to = request.args.get('assigned_to')
+        if assigned_to:
+            query = query.filter(Task.assigned_to == assigned_to)
+
+        if wants_stream():
+            return stream_query_response(query, Task, serialize_tasks, etag)
+
+        try:
+            tasks, next_cursor = paginate_query(query, Task)
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+
+        return page_response(serialize_tasks(tasks), next_cursor, etag)
 
     elif request.method == 'POST':
         data = request.json
@@ -450,57 +1463,329 @@ def handle_single_task(task_id):
         except Exception as e:
             return jsonify({"status": "error", "message": f"Failed to delete: {e}"}), 500
 
+# --- BULK CLIENT AND TASK ROUTES ---
+# POST /api/clients/bulk and /api/tasks/bulk take
+#   {"create": [{...}, ...], "update": [{"id": 1, ...}, ...], "delete": [1, 2, ...]}
+# Every valid item is applied in one transaction using executemany-style statements;
+# invalid items are skipped and reported individually in 'errors'.
+
+MAX_BULK_ITEMS = 5000
+
+# Writable fields per model, with the defaults used on create (None = no default)
+BULK_FIELDS = {
+    Client: {'name': None, 'status': 'Active', 'phone': None},
+    Task: {'name': None, 'due_date': 'N/A', 'priority': 'Medium', 'assigned_to': 'User'},
+}
+
+# Rows still referenced from another table cannot be deleted: (referencing column, what it is)
+BULK_DELETE_REFERENCES = {
+    Client: ((Invoice.client_id, 'invoices'),),
+}
+
+
+MAX_ROW_ID = 2 ** 63 - 1  # largest 64-bit integer primary key
+
+
+def is_row_id(value):
+    """True for an int (not a bool) in the primary key range, so it can be bound in a query."""
+    return isinstance(value, int) and not isinstance(value, bool) and 1 <= value <= MAX_ROW_ID
+
+
+def bulk_field_error(model, values):
+    """Checks each value against its column (type, nullability, length). Returns a message or None."""
+    for field, value in values.items():
+        column = model.__table__.c[field]
+        if value is None:
+            if not column.nullable:
+                return f"'{field}' cannot be null."
+        elif not isinstance(value, str):
+            return f"'{field}' must be a string."
+        elif getattr(column.type, 'length', None) and len(value) > column.type.length:
+            return f"'{field}' must be at most {column.type.length} characters."
+    return None
+
+
+def referenced_row_ids(model, row_ids):
+    """Maps each id in `row_ids` that another table still references to what references it."""
+    referenced = {}
+    for column, label in BULK_DELETE_REFERENCES.get(model, ()):
+        for row_id in db.session.execute(select(column).where(column.in_(row_ids)).distinct()).scalars():
+            referenced.setdefault(row_id, label)
+    return referenced
+
+
+def apply_bulk_changes(model, data):
+    """
+    Validates and applies a bulk request for `model`.
+    Returns (results, errors) or raises ValueError if the request itself is malformed.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("Request body must be a JSON object.")
+    creates = data.get('create') or []
+    updates = data.get('update') or []
+    deletes = data.get('delete') or []
+    if not all(isinstance(ops, list) for ops in (creates, updates, deletes)):
+        raise ValueError("'create', 'update' and 'delete' must be lists.")
+    if len(creates) + len(updates) + len(deletes) > MAX_BULK_ITEMS:
+        raise ValueError(f"A bulk request may contain at most {MAX_BULK_ITEMS} items.")
+
+    fields = BULK_FIELDS[model]
+    stat_columns = STAT_COLUMNS[model]
+    errors = []
+
+    # 1. Validate creates and fill in defaults
+    insert_rows, insert_indexes = [], []
+    for index, item in enumerate(creates):
+        if not isinstance(item, dict) or not item.get('name'):
+            errors.append({"op": "create", "index": index, "message": "'name' is required."})
+            continue
+        row = {field: item.get(field, default) for field, default in fields.items()}
+        message = bulk_field_error(model, row)
+        if message:
+            errors.append({"op": "create", "index": index, "message": message})
+            continue
+        insert_rows.append(row)
+        insert_indexes.append(index)
+
+    # 2. Validate updates and deletes against the rows that actually exist
+    update_ids = [item.get('id') for item in updates if isinstance(item, dict)]
+    lookup_ids = {row_id for row_id in update_ids + deletes if is_row_id(row_id)}
+    existing = {}
+    if lookup_ids:
+        existing_rows = db.session.execute(
+            select(model.id, *(getattr(model, column) for column in stat_columns)).where(model.id.in_(lookup_ids))
+        )
+        existing = {row[0]: dict(zip(stat_columns, row[1:])) for row in existing_rows}
+
+    # Each existing row may be touched at most once per request
+    touched = set()
+    update_rows = []
+    for index, item in enumerate(updates):
+        row_id = item.get('id') if isinstance(item, dict) else None
+        if not is_row_id(row_id):
+            errors.append({"op": "update", "index": index, "message": f"'id' must be an integer from 1 to {MAX_ROW_ID}."})
+            continue
+        if row_id not in existing:
+            errors.append({"op": "update", "index": index, "message": f"No {model.__tablename__} with id {row_id}."})
+            continue
+        if row_id in touched:
+            errors.append({"op": "update", "index": index, "message": f"Id {row_id} appears more than once."})
+            continue
+        touched.add(row_id)
+        changes = {field: item[field] for field in fields if field in item}
+        if 'name' in changes and not changes['name']:
+            errors.append({"op": "update", "index": index, "message": "'name' cannot be empty."})
+            continue
+        message = bulk_field_error(model, changes)
+        if message:
+            errors.append({"op": "update", "index": index, "message": message})
+            continue
+        if changes:
+            update_rows.append({'id': row_id, **changes})
+
+    referenced = referenced_row_ids(model, [row_id for row_id in deletes if is_row_id(row_id) and row_id in existing])
+    delete_ids = []
+    for index, row_id in enumerate(deletes):
+        if not is_row_id(row_id):
+            errors.append({"op": "delete", "index": index, "message": f"Ids to delete must be integers from 1 to {MAX_ROW_ID}."})
+            continue
+        if row_id not in existing:
+            errors.append({"op": "delete", "index": index, "message": f"No {model.__tablename__} with id {row_id}."})
+            continue
+        if row_id in referenced:
+            errors.append({"op": "delete", "index": index,
+                           "message": f"{model.__tablename__.capitalize()} {row_id} still has {referenced[row_id]}."})
+            continue
+        if row_id in touched:
+            errors.append({"op": "delete", "index": index, "message": f"Id {row_id} appears more than once."})
+            continue
+        touched.add(row_id)
+        delete_ids.append(row_id)
+
+    # 3. Apply everything in one transaction
+    deltas = {}
+    created_ids = []
+    if insert_rows:
+        created_ids = list(db.session.scalars(
+            insert(model).returning(model.id, sort_by_parameter_order=True), insert_rows
+        ))
+        for row in insert_rows:
+            add_stat_deltas(deltas, model, row, +1)
+    if update_rows:
+        db.session.execute(update(model), update_rows)
+        for row in update_rows:
+            before = existing[row['id']]
+            add_stat_deltas(deltas, model, before, -1)
+            add_stat_deltas(deltas, model, {column: row.get(column, before[column]) for column in stat_columns}, +1)
+    if delete_ids:
+        db.session.execute(delete(model).where(model.id.in_(delete_ids)))
+        for row_id in delete_ids:
+            add_stat_deltas(deltas, model, existing[row_id], -1)
+
+    connection = db.session.connection()
+    apply_stat_deltas(connection, deltas)
+    if insert_rows or update_rows or delete_ids:
+        bump_table_versions(connection, {model.__tablename__})
+    db.session.commit()
+
+    results = {
+        "created": [{"index": index, "id": row_id} for index, row_id in zip(insert_indexes, created_ids)],
+        "updated": [row['id'] for row in update_rows],
+        "deleted": delete_ids,
+    }
+    return results, errors
+
+
+def bulk_response(model):
+    try:
+        # Non-JSON bodies come through as None and are rejected as malformed (400)
+        results, errors = apply_bulk_changes(model, request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error applying bulk {model.__tablename__} changes: {e}")
+        return jsonify({"status": "error", "message": f"Failed to apply bulk changes: {e}"}), 500
+
+    return jsonify({
+        "status": "partial" if errors else "success",
+        "results": results,
+        "errors": errors,
+    }), 200
+
+
+@app.route('/api/clients/bulk', methods=['POST'])
+@login_required 
+def bulk_clients():
+    return bulk_response(Client)
+
+
+@app.route('/api/tasks/bulk', methods=['POST'])
+@login_required 
+def bulk_tasks():
+    return bulk_response(Task)
+
 # --- 7. INVOICE CRUD ROUTES ---
 
+def filter_invoices(query):
+    """Applies the status, client_id, date_from and date_to query parameters to an invoice select()."""
+    status = request.args.get('status')
+    if status:
+        query = query.filter(Invoice.status == status)
+    # Issue dates are stored as 'YYYY-MM-DD' strings, so they compare correctly as text
+    date_from = request.args.get('date_from')
+    if date_from:
+        query = query.filter(Invoice.issue_date >= date_from)
+    date_to = request.args.get('date_to')
+    if date_to:
+        query = query.filter(Invoice.issue_date <= date_to)
+    client_id = parse_int_arg('client_id')
+    if client_id is not None:
+        query = query.filter(Invoice.client_id == client_id)
+    return query
+
+
+def build_line_item_rows(line_items_data):
+    """
+    Validates submitted line items and computes each subtotal as quantity * unit_price.
+    Returns (rows ready for a bulk insert, invoice total). Raises ValueError on bad input.
+    """
+    if not isinstance(line_items_data, list):
+        raise ValueError("'line_items' must be a list.")
+
+    rows = []
+    total_amount = Decimal('0')
+    for index, item in enumerate(line_items_data):
+        try:
+            description = item['description']
+            quantity = int(item['quantity'])
+            unit_price = to_money(item['unit_price'])
+        except (KeyError, TypeError, ValueError, InvalidOperation):
+            raise ValueError(f"Line item {index} needs a description, an integer quantity and a numeric unit_price.")
+        if not description or quantity < 1 or not unit_price.is_finite() or unit_price < 0:
+            raise ValueError(f"Line item {index} has an empty description, a quantity below 1 or a negative price.")
+
+        subtotal = unit_price * quantity
+        total_amount += subtotal
+        rows.append({
+            'description': description,
+            'quantity': quantity,
+            'unit_price': unit_price,
+            'subtotal': subtotal,
+        })
+    return rows, total_amount
+
 @app.route('/api/invoices', methods=['GET', 'POST'])
 @login_required 
 def handle_invoices():
     if request.method == 'GET':
-        invoices = Invoice.query.all()
-        invoices_data = [invoice.to_dict() for invoice in invoices]
-        return jsonify(invoices_data)
+        # The invoice list embeds client names and line items, so it changes with those tables too
+        etag = collection_etag('invoice', 'line_item', 'client')
+        if request.if_none_match.contains(etag):
+            return not_modified_response(etag)
+
+        # The client name is joined into the main query and line items come from one extra
+        # IN query per page or stream batch, so the query count does not grow with the result.
+        if request.args.get('view') == 'summary':
+            serialize = serialize_invoice_summaries
+        else:
+            serialize = serialize_invoices
+        try:
+            query = filter_invoices(invoice_list_select())
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+
+        if wants_stream():
+            return stream_query_response(query, Invoice, serialize, etag)
+
+        try:
+            invoices, next_cursor = paginate_query(query, Invoice)
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+
+        return page_response(serialize(invoices), next_cursor, etag)
 
     elif request.method == 'POST':
         data = request.json
         try:
-            # 1. Calculate Total Amount from Line Items (Simple sum of subtotals)
-            total_amount = 0.0
-            line_items_data = data.get('line_items', [])
-            
-            for item in line_items_data:
-                try:
-                    total_amount += float(item['subtotal'])
-                except (ValueError, KeyError):
-                    return jsonify({"status": "error", "message": "Invalid or missing 'subtotal' in line items"}), 400
+            # 1. Validate line items and compute subtotals and the total on the server
+            line_item_rows, total_amount = build_line_item_rows(data.get('line_items', []))
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
 
-            # 2. Create the new Invoice object
+        client_id = data.get('client_id')
+        if not is_row_id(client_id) or db.session.get(Client, client_id) is None:
+            return jsonify({"status": "error", "message": f"No client with id {client_id}."}), 400
+
+        try:
+            # 2. Create the invoice and flush to get its id (nothing is committed yet)
             new_invoice = Invoice(
                 invoice_number=data['invoice_number'],
-                client_id=data['client_id'], 
+                client_id=client_id,
                 issue_date=data.get('issue_date', datetime.now().strftime("%Y-%m-%d")),
                 due_date=data.get('due_date'),
-                total_amount=f"{total_amount:.2f}",
+                total_amount=total_amount,
                 status=data.get('status', 'Draft')
             )
             db.session.add(new_invoice)
-            db.session.commit() 
-
-            # 3. Add Line Items
-            for item_data in line_items_data:
-                new_line_item = LineItem(
-                    description=item_data['description'],
-                    quantity=item_data['quantity'],
-                    unit_price=item_data['unit_price'],
-                    subtotal=item_data['subtotal'],
-                    invoice_id=new_invoice.id 
-                )
-                db.session.add(new_line_item)
-            
+            db.session.flush()
+
+            # 3. Insert all line items with one executemany statement
+            if line_item_rows:
+                for row in line_item_rows:
+                    row['invoice_id'] = new_invoice.id
+                db.session.execute(insert(LineItem), line_item_rows)
+                bump_table_versions(db.session.connection(), {'line_item'})
+
+            # 4. Serialize before committing, so a failure here cannot leave a committed invoice
+            # behind, then commit invoice and line items together
+            invoice_data = new_invoice.to_dict()
             db.session.commit()
-            
-            return jsonify({"status": "success", "invoice": new_invoice.to_dict()}), 201
+
+            return jsonify({"status": "success", "invoice": invoice_data}), 201
         
         except Exception as e:
+            db.session.rollback()
             print(f"Error creating invoice: {e}")
             return jsonify({"status": "error", "message": f"Failed to create invoice: {e}"}), 400
 
@@ -516,41 +1801,552 @@ def handle_single_invoice(invoice_id):
         try:
             db.session.delete(invoice)
             db.session.commit()
+            discard_invoice_pdfs(invoice_id)
             return jsonify({"status": "success", "message": "Invoice deleted"}), 200
         except Exception as e:
             return jsonify({"status": "error", "message": f"Failed to delete: {e}"}), 500
+
+
+@app.route('/api/invoices/<int:invoice_id>/pdf', methods=['GET'])
+@login_required 
+def download_invoice_pdf(invoice_id):
+    """Downloads the invoice PDF, rendering it only if the cached copy is out of date."""
+    invoice = Invoice.query.get_or_404(invoice_id)
+    download_name = f"invoice_{invoice.invoice_number}.pdf"
+    try:
+        snapshot = invoice_snapshot(invoice)
+        response = invoice_pdf_response(invoice_pdf_filename(snapshot), download_name)
+        pdf_cache_metrics.record_lookup(response is not None)
+        if response is None:
+            result = submit_pdf_render(snapshot).result(timeout=PDF_RENDER_TIMEOUT)
+            response = rendered_pdf_response(snapshot, result, download_name)
+    except Exception as e:
+        print(f"PDF GENERATION ERROR: {e}")
+        return jsonify({"status": "error", "message": "Failed to generate invoice PDF."}), 500
+    return response
+
+
+@app.route('/api/invoices/<int:invoice_id>/render', methods=['POST'])
+@login_required 
+def render_invoice(invoice_id):
+    """Queues a background PDF render; poll /api/render_jobs/<job_id> for the result."""
+    invoice = Invoice.query.get_or_404(invoice_id)
+    try:
+        job = submit_render_job(invoice)
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error queueing PDF render: {e}")
+        return jsonify({"status": "error", "message": "Failed to queue PDF render."}), 500
+
+    return jsonify({"status": "success", "job": render_job_dict(job)}), 202
+
+
+# --- BATCH PDF EXPORT ---
+# GET /api/invoices/export streams a ZIP of the PDFs of every invoice matching the list
+# filters. Cached PDFs go out immediately; missing ones are rendered in the worker pool and
+# added as each finishes. The archive is written to the response as it is produced, so it
+# is never held in memory or on disk as a whole.
+
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+
+class ZipChunkBuffer:
+    """Write-only file object that collects zip output until it is drained into the response."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def export_entry_name(snapshot):
+    return f"invoice_{secure_filename(snapshot['invoice_number'])}_{snapshot['id']}.pdf"
+
+
+def rendered_invoice_pdfs(query, errors):
+    """
+    Yields (entry name, binary file object) for every invoice in the query, rendering missing
+    PDFs in the worker pool with a bounded number in flight. Failed renders are added to `errors`.
+    """
+    max_in_flight = PDF_RENDER_WORKERS * 2
+    pending = {}
+
+    def collect(futures):
+        for future in futures:
+            snapshot = pending.pop(future)
+            name = export_entry_name(snapshot)
+            try:
+                result = future.result()
+                store_rendered_pdf(snapshot, result)
+            except Exception as e:
+                errors.append(f"{name}: {e}")
+                continue
+            # Open the render result itself: a bounded memory cache may already have evicted it
+            yield name, io.BytesIO(result) if PDF_STORAGE == 'memory' else open(result, 'rb')
+
+    result = db.session.execute(query.order_by(Invoice.id).execution_options(yield_per=STREAM_BATCH_SIZE))
+    for rows in result.partitions():
+        for data in serialize_invoices(rows):
+            snapshot = snapshot_from_invoice_dict(data)
+            cached = open_cached_pdf(invoice_pdf_filename(snapshot))
+            pdf_cache_metrics.record_lookup(cached is not None)
+            if cached:
+                yield export_entry_name(snapshot), cached
+                continue
+            pending[submit_pdf_render(snapshot)] = snapshot
+            if len(pending) >= max_in_flight:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                yield from collect(done)
+
+    while pending:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        yield from collect(done)
+
+
+@app.route('/api/invoices/export', methods=['GET'])
+@login_required 
+def export_invoice_pdfs():
+    try:
+        query = filter_invoices(invoice_list_select())
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    def generate():
+        buffer = ZipChunkBuffer()
+        errors = []
+        with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_STORED) as archive:
+            for entry_name, pdf_file in rendered_invoice_pdfs(query, errors):
+                info = zipfile.ZipInfo(entry_name, date_time=datetime.now().timetuple()[:6])
+                with pdf_file as source, archive.open(info, 'w') as target:
+                    while True:
+                        chunk = source.read(EXPORT_CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        target.write(chunk)
+                        yield buffer.drain()
+                yield buffer.drain()
+            if errors:
+                archive.writestr('errors.txt', '\n'.join(errors) + '\n')
+        yield buffer.drain()
+
+    filename = f"invoices_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
+    response = app.response_class(stream_with_context(generate()), mimetype='application/zip')
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+@app.route('/api/render_jobs/<job_id>', methods=['GET'])
+@login_required 
+def get_render_job(job_id):
+    job = db.get_or_404(RenderJob, job_id)
+    return jsonify(render_job_dict(job))
+
+
+def render_job_dict(job):
+    data = job.to_dict()
+    if job.status == 'done':
+        data['download_url'] = url_for('download_invoice_pdf', invoice_id=job.invoice_id)
+    return data
+
+
+@app.route('/api/pdf_cache/metrics', methods=['GET'])
+@login_required 
+def get_pdf_cache_metrics():
+    """PDF cache usage, and hit rate and evictions since this worker process started."""
+    files, bytes_stored = pdf_cache_usage()
+    max_bytes = PDF_MEMORY_CACHE_BYTES if PDF_STORAGE == 'memory' else PDF_DISK_CACHE_BYTES
+    return jsonify(dict(
+        pdf_cache_metrics.to_dict(),
+        storage=PDF_STORAGE,
+        files=files,
+        bytes_stored=bytes_stored,
+        max_bytes=max_bytes,
+        ttl_seconds=PDF_CACHE_TTL,
+    ))
             
 # --- 8. DASHBOARD STATISTICS ROUTE ---
 
 @app.route('/api/stats', methods=['GET'])
 @login_required 
 def get_dashboard_stats():
-    total_clients = Client.query.count()
-    total_tasks = Task.query.count()
-    pending_clients = Client.query.filter_by(status='Pending').count()
-    high_priority_tasks = Task.query.filter_by(priority='High').count()
-    total_invoices = Invoice.query.count()
-    outstanding_invoices = Invoice.query.filter(Invoice.status.in_(['Draft', 'Sent'])).count()
+    counters = dict(db.session.execute(select(StatCounter.name, StatCounter.value)).all())
+    return jsonify({name: counters.get(name, 0) for name in STAT_COUNTER_NAMES})
     
-    return jsonify({
-        "total_clients": total_clients,
-        "total_tasks": total_tasks,
-        "pending_clients": pending_clients,
-        "high_priority_tasks": high_priority_tasks,
-        "total_invoices": total_invoices,
-        "outstanding_invoices": outstanding_invoices
-    })
+# --- REVENUE ROUTES ---
+# Revenue figures are aggregated by the database (SUM over integer cents) instead of
+# loading invoices into Python.
+
+def revenue_columns():
+    outstanding = case((Invoice.status.in_(OUTSTANDING_INVOICE_STATUSES), Invoice.total_amount), else_=0)
+    return (
+        func.count(Invoice.id).label('invoice_count'),
+        func.coalesce(func.sum(Invoice.total_amount), 0).label('total_invoiced'),
+        func.coalesce(func.sum(outstanding), 0).label('outstanding'),
+    )
+
+
+@app.route('/api/revenue', methods=['GET'])
+@login_required 
+def get_revenue():
+    row = db.session.execute(select(*revenue_columns())).one()
+    return jsonify(row._asdict())
+
+
+@app.route('/api/revenue/clients', methods=['GET'])
+@login_required 
+def get_revenue_by_client():
+    rows = db.session.execute(
+        select(Client.id.label('client_id'), Client.name.label('client_name'), *revenue_columns())
+        .join(Invoice, Invoice.client_id == Client.id)
+        .group_by(Client.id, Client.name)
+        .order_by(func.sum(Invoice.total_amount).desc(), Client.id)
+    )
+    return jsonify([row._asdict() for row in rows])
     
 # --- 9. WHATSAPP API INTEGRATION ROUTES ---
 
+# --- WHATSAPP OUTBOX ---
+# The send routes only record the message in the outbox table and return 202 with its id.
+# Background sender threads claim due messages and post them to Twilio, so a slow or
+# unreachable Twilio never holds up a web worker. Because the outbox lives in the database,
+# queued messages survive restarts: a message claimed by a process that died mid-send is
+# picked up again once its lease expires.
+
+OUTBOX_SENDER_THREADS = int(os.environ.get('OUTBOX_SENDER_THREADS', 2))
+OUTBOX_POLL_SECONDS = 2
+OUTBOX_BATCH_SIZE = 10
+OUTBOX_MAX_ATTEMPTS = 5
+OUTBOX_RETRY_SECONDS = 30  # doubled after every failed attempt
+OUTBOX_LEASE_SECONDS = 300  # a 'sending' message older than this is assumed abandoned
+
+
+class OutboxMessage(db.Model):
+    id = Column(String(32), primary_key=True)
+    to_number = Column(String(50), nullable=False)
+    body = Column(Text, nullable=False)
+    invoice_id = Column(Integer, index=True)  # set when the invoice PDF is attached
+    status = Column(String(20), nullable=False, default='queued', index=True)  # queued, sending, sent, failed
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(String(50), index=True)
+    claimed_at = Column(String(50))
+    twilio_sid = Column(String(64))
+    error = Column(Text)
+    created_at = Column(String(50), nullable=False)
+    sent_at = Column(String(50))
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'to': self.to_number,
+            'invoice_id': self.invoice_id,
+            'status': self.status,
+            'attempts': self.attempts,
+            'next_attempt_at': self.next_attempt_at if self.status == 'queued' else None,
+            'twilio_sid': self.twilio_sid,
+            'error': self.error,
+            'created_at': self.created_at,
+            'sent_at': self.sent_at,
+        }
+
+
+class UnsendableMessage(Exception):
+    """The message can never be sent (e.g. its invoice was deleted), so it is not retried."""
+
+
+outbox_wakeup = threading.Event()
+
+
+def enqueue_whatsapp_message(to_number, body, invoice_id=None):
+    """Stores a message in the outbox and wakes the sender. Returns the OutboxMessage."""
+    if not to_number.startswith('whatsapp:'):
+        to_number = f'whatsapp:{to_number}'
+    now = datetime.now().isoformat()
+    message = OutboxMessage(id=uuid.uuid4().hex, to_number=to_number, body=body, invoice_id=invoice_id,
+                            status='queued', attempts=0, created_at=now, next_attempt_at=now)
+    db.session.add(message)
+    db.session.commit()
+    outbox_wakeup.set()
+    return message
+
+
+def claim_outbox_messages():
+    """
+    Marks up to OUTBOX_BATCH_SIZE due messages as 'sending' for this thread and returns
+    (message_id, claimed_at) pairs. Each claim is a conditional UPDATE, so concurrent senders
+    (threads or processes) never share a message; claimed_at identifies this sender's claim.
+    """
+    now = datetime.now()
+    due = or_(
+        and_(OutboxMessage.status == 'queued', OutboxMessage.next_attempt_at <= now.isoformat()),
+        and_(OutboxMessage.status == 'sending',
+             OutboxMessage.claimed_at < (now - timedelta(seconds=OUTBOX_LEASE_SECONDS)).isoformat()),
+    )
+    candidates = db.session.execute(
+        select(OutboxMessage.id).where(due).order_by(OutboxMessage.created_at).limit(OUTBOX_BATCH_SIZE)
+    ).scalars().all()
+
+    claimed = []
+    for message_id in candidates:
+        result = db.session.execute(
+            update(OutboxMessage)
+            .where(OutboxMessage.id == message_id, due)
+            .values(status='sending', claimed_at=now.isoformat())
+        )
+        if result.rowcount == 1:
+            claimed.append((message_id, now.isoformat()))
+    db.session.commit()
+    return claimed
+
+
+def renew_outbox_claim(message_id, claimed_at):
+    """
+    Restarts the lease on a message this sender claimed at `claimed_at`. Returns False if
+    the lease ran out and another sender has reclaimed the message. The caller commits (or
+    rolls back); pending changes are not flushed, so nothing is written to a lost message.
+    """
+    with db.session.no_autoflush:
+        result = db.session.execute(
+            update(OutboxMessage)
+            .where(OutboxMessage.id == message_id, OutboxMessage.status == 'sending',
+                   OutboxMessage.claimed_at == claimed_at)
+            .values(claimed_at=datetime.now().isoformat())
+        )
+    return result.rowcount == 1
+
+
+def deliver_outbox_message(message_id, claimed_at):
+    """
+    Sends one claimed message and records the outcome. Messages later in a batch can wait
+    past OUTBOX_LEASE_SECONDS, so the lease is renewed right before sending and the message
+    is skipped if another sender has reclaimed it in the meantime.
+    """
+    message = db.session.get(OutboxMessage, message_id)
+    if message is None or message.status != 'sending' or message.claimed_at != claimed_at:
+        return
+    message.attempts += 1
+    try:
+        invoice = media_url = None
+        if message.invoice_id is not None:
+            invoice = db.session.get(Invoice, message.invoice_id)
+            if invoice is None:
+                raise UnsendableMessage("Invoice no longer exists.")
+            # CRITICAL: PUBLIC_BASE_URL MUST be publicly accessible for Twilio to download the PDF.
+            media_url = signed_media_url(render_invoice_pdf_in_pool(invoice))
+
+        if not renew_outbox_claim(message_id, claimed_at):
+            db.session.rollback()
+            print(f"WHATSAPP SEND {message_id} SKIPPED: claimed by another sender")
+            return
+        db.session.commit()
+        message.twilio_sid = twilio_client.send_message(message.to_number, message.body, media_url).get('sid')
+        message.status = 'sent'
+        message.sent_at = datetime.now().isoformat()
+        message.error = None
+        if invoice is not None:
+            invoice.status = 'Sent'
+    except CircuitOpenError as e:
+        # Twilio was not contacted, so this does not use up one of the message's attempts
+        message.attempts -= 1
+        message.status = 'queued'
+        delay = max(e.retry_after, OUTBOX_POLL_SECONDS)
+        message.next_attempt_at = (datetime.now() + timedelta(seconds=delay)).isoformat()
+    except Exception as e:
+        retryable = not isinstance(e, UnsendableMessage) and getattr(e, 'retryable', True)
+        message.error = str(e)
+        if retryable and message.attempts < OUTBOX_MAX_ATTEMPTS:
+            delay = max(OUTBOX_RETRY_SECONDS * 2 ** (message.attempts - 1), getattr(e, 'retry_after', None) or 0)
+            message.status = 'queued'
+            message.next_attempt_at = (datetime.now() + timedelta(seconds=delay)).isoformat()
+        else:
+            message.status = 'failed'
+        print(f"WHATSAPP SEND {message_id} FAILED (attempt {message.attempts}): {e}")
+    db.session.commit()
+
+
+def run_outbox_sender():
+    """
+    Sender thread: drains due messages, then sleeps until woken or the poll interval passes.
+    While the Twilio circuit breaker is open, messages are left queued rather than claimed.
+    """
+    while True:
+        outbox_wakeup.wait(OUTBOX_POLL_SECONDS)
+        outbox_wakeup.clear()
+        try:
+            with app.app_context():
+                while twilio_breaker.available():
+                    claimed = claim_outbox_messages()
+                    if not claimed:
+                        break
+                    for message_id, claimed_at in claimed:
+                        deliver_outbox_message(message_id, claimed_at)
+        except Exception as e:
+            print(f"!!! OUTBOX SENDER ERROR: {e} !!!")
+
+
+def start_outbox_sender():
+    for n in range(OUTBOX_SENDER_THREADS):
+        threading.Thread(target=run_outbox_sender, name=f'outbox-sender-{n}', daemon=True).start()
+    print("--- WhatsApp Outbox Sender Started ---")
+
+
+# --- IDEMPOTENCY KEYS ---
+# A client (or a proxy) that retries a send can pass the same Idempotency-Key header on
+# every attempt. The first request claims the key by inserting its row; the response is
+# stored on that row and replayed for every repeat within IDEMPOTENCY_KEY_TTL, so a retry
+# never queues (and pays for) a second message. A repeat that arrives while the first
+# request is still running waits for its result instead of running the route again.
+
+IDEMPOTENCY_KEY_TTL = int(os.environ.get('IDEMPOTENCY_KEY_TTL_HOURS', 24)) * 3600
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+IDEMPOTENCY_WAIT_SECONDS = 10  # how long a repeat waits for the in-flight request
+IDEMPOTENCY_POLL_SECONDS = 0.05
+IDEMPOTENCY_LEASE_SECONDS = 60  # an in-flight claim older than this is assumed abandoned
+
+
+class IdempotencyKey(db.Model):
+    id = Column(String(64), primary_key=True)  # sha256 of the user id and the client's key
+    request_hash = Column(String(64), nullable=False)
+    status = Column(String(20), nullable=False, default='in_progress')  # in_progress, done
+    status_code = Column(Integer)
+    response_body = Column(Text)
+    created_at = Column(String(50), nullable=False)
+    expires_at = Column(String(50), nullable=False, index=True)
+
+
+def request_fingerprint():
+    """Hash of the method, path and body, so a key reused for a different request is caught."""
+    payload = request.get_json(silent=True)
+    body = json.dumps(payload, sort_keys=True) if payload is not None else request.get_data(as_text=True)
+    return hashlib.sha256(f"{request.method} {request.path}\n{body}".encode('utf-8')).hexdigest()
+
+
+def claim_idempotency_key(key_id, request_hash):
+    """
+    Returns None if this request now owns the key, or the existing IdempotencyKey row.
+    Expired keys and abandoned claims are taken over with a conditional UPDATE, so only
+    one of several concurrent requests can win them.
+    """
+    now = datetime.now()
+    values = dict(request_hash=request_hash, status='in_progress', status_code=None, response_body=None,
+                  created_at=now.isoformat(), expires_at=(now + timedelta(seconds=IDEMPOTENCY_KEY_TTL)).isoformat())
+    try:
+        db.session.execute(insert(IdempotencyKey).values(id=key_id, **values))
+        db.session.commit()
+        return None
+    except IntegrityError:
+        db.session.rollback()
+
+    reclaimable = or_(
+        IdempotencyKey.expires_at < now.isoformat(),
+        and_(IdempotencyKey.status == 'in_progress',
+             IdempotencyKey.created_at < (now - timedelta(seconds=IDEMPOTENCY_LEASE_SECONDS)).isoformat()),
+    )
+    result = db.session.execute(
+        update(IdempotencyKey).where(IdempotencyKey.id == key_id, reclaimable).values(**values)
+    )
+    db.session.commit()
+    if result.rowcount == 1:
+        return None
+    return db.session.get(IdempotencyKey, key_id)
+
+
+def wait_for_idempotent_result(key_id):
+    """Polls until the in-flight request for this key finishes; None if it is gone or still running."""
+    deadline = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+    while time.monotonic() < deadline:
+        time.sleep(IDEMPOTENCY_POLL_SECONDS)
+        db.session.expire_all()
+        record = db.session.get(IdempotencyKey, key_id)
+        if record is None or record.status == 'done':
+            return record
+    return None
+
+
+def release_idempotency_key(key_id):
+    """Drops an unfinished claim so the client's retry runs the request again."""
+    db.session.rollback()
+    db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.id == key_id,
+                                                    IdempotencyKey.status == 'in_progress'))
+    db.session.commit()
+
+
+def replay_idempotent_response(record):
+    return Response(record.response_body, status=record.status_code, mimetype='application/json',
+                    headers={'Idempotent-Replayed': 'true'})
+
+
+def idempotent(view):
+    """
+    Makes a POST route honour the Idempotency-Key header (requests without it run as before).
+    2xx and 4xx responses are stored and replayed; after a 5xx or an exception the key is
+    released, since nothing was queued and the client should be able to retry.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if key is None:
+            return view(*args, **kwargs)
+        if not key.strip() or len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+            return jsonify({"status": "error",
+                            "message": f"Idempotency-Key must be 1 to {IDEMPOTENCY_KEY_MAX_LENGTH} characters."}), 400
+
+        key_id = hashlib.sha256(f"{current_user.id}:{key}".encode('utf-8')).hexdigest()
+        request_hash = request_fingerprint()
+        record = claim_idempotency_key(key_id, request_hash)
+        if record is not None:
+            if record.request_hash != request_hash:
+                return jsonify({"status": "error",
+                                "message": "This Idempotency-Key was already used for a different request."}), 422
+            if record.status != 'done':
+                record = wait_for_idempotent_result(key_id)
+                if record is None or record.request_hash != request_hash:
+                    return jsonify({"status": "error",
+                                    "message": "A request with this Idempotency-Key is still in progress."}), 409
+            return replay_idempotent_response(record)
+
+        try:
+            response = make_response(view(*args, **kwargs))
+        except Exception:
+            release_idempotency_key(key_id)
+            raise
+        if response.status_code >= 500:
+            release_idempotency_key(key_id)
+            return response
+
+        db.session.execute(
+            update(IdempotencyKey).where(IdempotencyKey.id == key_id)
+            .values(status='done', status_code=response.status_code, response_body=response.get_data(as_text=True))
+        )
+        db.session.commit()
+        return response
+    return wrapper
+
+
+def queued_message_response(message, text):
+    if not twilio_breaker.available():
+        text += " Twilio is currently unavailable; it will be sent once it recovers."
+    return jsonify({
+        "status": "success",
+        "message": text,
+        "message_id": message.id,
+        "status_url": url_for('get_message_status', message_id=message.id),
+    }), 202
+
+
 @app.route('/api/send_whatsapp', methods=['POST'])
 @login_required 
+@idempotent
 def send_whatsapp_message():
-    # IMPORTANT: Access secure tokens using os.environ.get()
-    current_twilio_sid = os.environ.get('TWILIO_ACCOUNT_SID', TWILIO_ACCOUNT_SID)
-    current_twilio_token = os.environ.get('TWILIO_AUTH_TOKEN', TWILIO_AUTH_TOKEN)
-    current_whatsapp_sender = os.environ.get('WHATSAPP_SENDER', WHATSAPP_SENDER)
-    
     data = request.json
     recipient_phone = data.get('phone')
     message_body = data.get('message')
@@ -558,37 +2354,19 @@ def send_whatsapp_message():
     if not recipient_phone or not message_body:
         return jsonify({"status": "error", "message": "Missing phone number or message body."}), 400
 
-    if not recipient_phone.startswith('whatsapp:'):
-        recipient_phone = f'whatsapp:{recipient_phone}'
-
-    TWILIO_SMS_URL = f"https://api.twilio.com/2010-04-01/Accounts/{current_twilio_sid}/Messages.json"
-
-    payload = {
-        'To': recipient_phone,
-        'From': current_whatsapp_sender,
-        'Body': message_body,
-    }
-
     try:
-        response = requests.post(
-            TWILIO_SMS_URL,
-            data=payload,
-            auth=(current_twilio_sid, current_twilio_token)
-        )
-        
-        if response.status_code in [200, 201]:
-            return jsonify({"status": "success", "message": "WhatsApp message successfully queued."}), 200
-        else:
-            print(f"Twilio Error Response: {response.text}")
-            return jsonify({"status": "error", "message": f"Twilio API failed: {response.status_code}"}), 500
-
+        message = enqueue_whatsapp_message(recipient_phone, message_body)
     except Exception as e:
-        print(f"Network or API Call Exception: {e}")
-        return jsonify({"status": "error", "message": "Failed to connect to WhatsApp service."}), 500
+        db.session.rollback()
+        print(f"Error queueing WhatsApp message: {e}")
+        return jsonify({"status": "error", "message": "Failed to queue WhatsApp message."}), 500
+
+    return queued_message_response(message, "WhatsApp message queued.")
 
 
 @app.route('/api/send_invoice/<int:invoice_id>', methods=['POST'])
 @login_required 
+@idempotent
 def send_invoice_whatsapp(invoice_id):
     invoice = Invoice.query.get_or_404(invoice_id)
     
@@ -596,52 +2374,451 @@ def send_invoice_whatsapp(invoice_id):
     recipient_phone = invoice.client.phone
     if not recipient_phone:
         return jsonify({"status": "error", "message": f"Client {invoice.client.name} has no phone number recorded."}), 400
-        
-    # 1. Generate the PDF
+
+    # The PDF is rendered (or taken from the cache) by the sender, just before the message goes out
+    body = f'Hello {invoice.client.name}, your Invoice #{invoice.invoice_number} for ${invoice.total_amount} is attached.'
     try:
-        pdf_local_path = generate_invoice_pdf(invoice)
+        message = enqueue_whatsapp_message(recipient_phone, body, invoice_id=invoice.id)
     except Exception as e:
-        print(f"PDF GENERATION ERROR: {e}")
-        return jsonify({"status": "error", "message": "Failed to generate invoice PDF."}), 500
+        db.session.rollback()
+        print(f"Error queueing invoice message: {e}")
+        return jsonify({"status": "error", "message": "Failed to queue invoice message."}), 500
 
-    # 2. Get Twilio Credentials
-    current_twilio_sid = os.environ.get('TWILIO_ACCOUNT_SID', TWILIO_ACCOUNT_SID)
-    current_twilio_token = os.environ.get('TWILIO_AUTH_TOKEN', TWILIO_AUTH_TOKEN)
-    current_whatsapp_sender = os.environ.get('WHATSAPP_SENDER', WHATSAPP_SENDER)
+    return queued_message_response(message, f"Invoice {invoice.invoice_number} queued for WhatsApp delivery.")
 
-    # 3. Create Public URL Placeholder
-    # CRITICAL: This URL MUST be publicly accessible for Twilio to download the PDF.
-    PUBLIC_BASE_URL = os.environ.get('PUBLIC_BASE_URL', "http://YOUR_NGROK_URL_OR_SERVER_IP") # <-- Using os.environ.get for security
-    media_url = f"{PUBLIC_BASE_URL}/temp_invoices/{os.path.basename(pdf_local_path)}"
 
-    TWILIO_SMS_URL = f"https://api.twilio.com/2010-04-01/Accounts/{current_twilio_sid}/Messages.json"
+@app.route('/api/messages/<message_id>', methods=['GET'])
+@login_required 
+def get_message_status(message_id):
+    message = db.session.get(OutboxMessage, message_id)
+    if message is None:
+        return jsonify({"status": "error", "message": "Message not found."}), 404
+    data = message.to_dict()
+    # Most recent status callback received (they may arrive out of order)
+    data['last_reported_status'] = None
+    if message.twilio_sid:
+        data['last_reported_status'] = db.session.execute(
+            select(MessageLog.status).where(MessageLog.message_sid == message.twilio_sid)
+            .order_by(MessageLog.id.desc()).limit(1)
+        ).scalar()
+    return jsonify(data)
+
+
+@app.route('/api/twilio/circuit', methods=['GET'])
+@login_required 
+def get_twilio_circuit():
+    """State of the Twilio circuit breaker: closed, open or half_open, plus trip counts."""
+    return jsonify(twilio_breaker.stats())
+
+
+# --- WHATSAPP BROADCASTS ---
+# POST /api/broadcasts sends a templated message to every client matching a filter. The
+# recipients are written to broadcast_recipient up front; a background thread then fans
+# out with aiohttp (whatsapp_broadcast.py), rate limited to the sender's Twilio
+# throughput, and records results in batches once a second. A broadcast whose thread died
+# (its heartbeat went stale) is resumed by the scheduler from the recipients still queued.
+# The rate limit applies per broadcast; concurrent broadcasts share Twilio's limit through
+# its 429 + Retry-After responses, which pause the whole broadcast.
+
+BROADCAST_RATE = float(os.environ.get('TWILIO_SENDER_MPS', 80))  # messages per second
+BROADCAST_CONCURRENCY = int(os.environ.get('BROADCAST_CONCURRENCY', 50))
+BROADCAST_FLUSH_SECONDS = 1
+BROADCAST_LEASE_SECONDS = 120
+BROADCAST_FILTERS = ('status', 'client_ids')
+BROADCAST_TEMPLATE_FIELDS = ('name', 'phone', 'status')
+
+broadcast_sender = BroadcastSender(
+    TWILIO_ACCOUNT_SID,
+    TWILIO_AUTH_TOKEN,
+    WHATSAPP_SENDER,
+    base_url=os.environ.get('TWILIO_API_BASE', TWILIO_API_BASE),
+    status_callback=TWILIO_STATUS_CALLBACK_URL,
+    rate=BROADCAST_RATE,
+    concurrency=BROADCAST_CONCURRENCY,
+    breaker=twilio_breaker,
+)
+
+
+class Broadcast(db.Model):
+    id = Column(String(32), primary_key=True)
+    template = Column(Text, nullable=False)
+    client_filter = Column(Text, nullable=False)  # JSON
+    status = Column(String(20), nullable=False, default='running', index=True)  # running, done
+    total = Column(Integer, nullable=False, default=0)
+    sent = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    heartbeat_at = Column(String(50))
+    created_at = Column(String(50), nullable=False)
+    finished_at = Column(String(50))
 
-    # 4. Message payload (Uses MediaUrl for the PDF)
-    payload = {
-        'To': f'whatsapp:{recipient_phone}',
-        'From': current_whatsapp_sender,
-        'Body': f'Hello {invoice.client.name}, your Invoice #{invoice.invoice_number} for ${invoice.total_amount} is attached.',
-        'MediaUrl': media_url, 
-    }
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'template': self.template,
+            'filter': json.loads(self.client_filter),
+            'status': self.status,
+            'total': self.total,
+            'sent': self.sent,
+            'failed': self.failed,
+            'pending': self.total - self.sent - self.failed,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at,
+        }
+
+
+class BroadcastRecipient(db.Model):
+    id = Column(Integer, primary_key=True)
+    broadcast_id = Column(String(32), ForeignKey('broadcast.id'), nullable=False, index=True)
+    client_id = Column(Integer, nullable=False)
+    to_number = Column(String(50), nullable=False)
+    body = Column(Text, nullable=False)
+    status = Column(String(20), nullable=False, default='queued')  # queued, sent, failed
+    twilio_sid = Column(String(64))
+    error = Column(Text)
+    finished_at = Column(String(50))
+
+
+BROADCAST_RECIPIENT_COLUMNS = (
+    BroadcastRecipient.id, BroadcastRecipient.client_id, BroadcastRecipient.to_number.label('to'),
+    BroadcastRecipient.status, BroadcastRecipient.twilio_sid, BroadcastRecipient.error, BroadcastRecipient.finished_at,
+)
+serialize_broadcast_recipient_row = make_row_serializer(BROADCAST_RECIPIENT_COLUMNS)
+
+
+def render_message_template(template, fields):
+    """Replaces {field} placeholders; unknown placeholders are left as they are."""
+    return re.sub(r'\{(\w+)\}', lambda match: str(fields.get(match.group(1), match.group(0))), template)
+
+
+def broadcast_filter_error(client_filter):
+    """Checks a broadcast filter's fields and value types. Returns a message or None."""
+    unknown = set(client_filter) - set(BROADCAST_FILTERS)
+    if unknown:
+        return f"Unknown filter field(s): {', '.join(sorted(unknown))}."
+    if 'status' in client_filter:
+        status = client_filter['status']
+        statuses = [status] if isinstance(status, str) else status
+        if not isinstance(statuses, list) or not statuses or not all(isinstance(value, str) and value for value in statuses):
+            return "'status' must be a non-empty string or a non-empty list of strings."
+    if 'client_ids' in client_filter:
+        client_ids = client_filter['client_ids']
+        if not isinstance(client_ids, list) or not client_ids or not all(is_row_id(value) for value in client_ids):
+            return "'client_ids' must be a non-empty list of integer ids."
+    return None
+
+
+def broadcast_client_select(client_filter):
+    """Clients with a phone number that match a broadcast filter (checked with broadcast_filter_error)."""
+    query = select(Client.id, Client.name, Client.phone, Client.status).where(Client.phone.is_not(None), Client.phone != '')
+    status = client_filter.get('status')
+    if status is not None:
+        query = query.where(Client.status.in_([status] if isinstance(status, str) else status))
+    client_ids = client_filter.get('client_ids')
+    if client_ids is not None:
+        query = query.where(Client.id.in_(client_ids))
+    return query.order_by(Client.id)
+
+
+def create_broadcast(template, client_filter):
+    """Stores the broadcast and its rendered per-recipient messages. Returns the Broadcast."""
+    now = datetime.now().isoformat()
+    broadcast = Broadcast(id=uuid.uuid4().hex, template=template, client_filter=json.dumps(client_filter),
+                          status='running', total=0, sent=0, failed=0, heartbeat_at=now, created_at=now)
+    db.session.add(broadcast)
+    db.session.flush()
+
+    result = db.session.execute(broadcast_client_select(client_filter).execution_options(yield_per=STREAM_BATCH_SIZE))
+    for rows in result.partitions():
+        recipients = []
+        for row in rows:
+            fields = {name: getattr(row, name) for name in BROADCAST_TEMPLATE_FIELDS}
+            phone = row.phone if row.phone.startswith('whatsapp:') else f'whatsapp:{row.phone}'
+            recipients.append({'broadcast_id': broadcast.id, 'client_id': row.id, 'to_number': phone,
+                               'body': render_message_template(template, fields), 'status': 'queued'})
+        db.session.execute(insert(BroadcastRecipient), recipients)
+        broadcast.total += len(recipients)
+
+    if broadcast.total == 0:
+        broadcast.status = 'done'
+        broadcast.finished_at = now
+    db.session.commit()
+    return broadcast
+
+
+def record_broadcast_results(broadcast_id, results, finished=False):
+    """Writes a batch of (recipient id, ok, sid, error) results in one transaction."""
+    with app.app_context():
+        now = datetime.now().isoformat()
+        if results:
+            db.session.execute(update(BroadcastRecipient), [
+                {'id': recipient_id, 'status': 'sent' if ok else 'failed', 'twilio_sid': sid,
+                 'error': error, 'finished_at': now}
+                for recipient_id, ok, sid, error in results
+            ])
+        sent = sum(1 for _, ok, _, _ in results if ok)
+        values = {
+            'sent': Broadcast.sent + sent,
+            'failed': Broadcast.failed + (len(results) - sent),
+            'heartbeat_at': now,
+        }
+        if finished:
+            values.update(status='done', finished_at=now)
+        db.session.execute(update(Broadcast).where(Broadcast.id == broadcast_id).values(**values))
+        db.session.commit()
+
+
+def run_broadcast(broadcast_id):
+    """Sends a broadcast's queued recipients (runs on its own thread and event loop)."""
+    with app.app_context():
+        recipients = db.session.execute(
+            select(BroadcastRecipient.id, BroadcastRecipient.to_number, BroadcastRecipient.body)
+            .where(BroadcastRecipient.broadcast_id == broadcast_id, BroadcastRecipient.status == 'queued')
+            .order_by(BroadcastRecipient.id)
+        ).all()
+    results = []
+    reported = 0
+
+    def report(*result):
+        nonlocal reported
+        reported += 1
+        results.append(result)
+
+    def take_results():
+        batch = results[:]
+        del results[:len(batch)]
+        return batch
+
+    async def flush_periodically():
+        while True:
+            await asyncio.sleep(BROADCAST_FLUSH_SECONDS)
+            await asyncio.to_thread(record_broadcast_results, broadcast_id, take_results())
+
+    async def send_all():
+        flusher = asyncio.create_task(flush_periodically())
+        try:
+            await broadcast_sender.run([tuple(row) for row in recipients], report)
+        finally:
+            flusher.cancel()
+        # Recipients the circuit breaker held back stay queued; resume_stalled_broadcasts
+        # restarts the broadcast once its heartbeat goes stale
+        finished = reported == len(recipients)
+        record_broadcast_results(broadcast_id, take_results(), finished=finished)
+        return finished
 
     try:
-        response = requests.post(
-            TWILIO_SMS_URL,
-            data=payload,
-            auth=(current_twilio_sid, current_twilio_token)
-        )
-        
-        if response.status_code in [200, 201]:
-            invoice.status = 'Sent'
-            db.session.commit()
-            return jsonify({"status": "success", "message": f"Invoice {invoice.invoice_number} sent via WhatsApp."}), 200
+        if asyncio.run(send_all()):
+            print(f"--- BROADCAST {broadcast_id} FINISHED ---")
         else:
-            print(f"Twilio Error Response: {response.text}")
-            return jsonify({"status": "error", "message": f"Twilio API failed: {response.status_code}"}), 500
+            print(f"--- BROADCAST {broadcast_id} PAUSED: Twilio circuit breaker is open ---")
+    except Exception as e:
+        print(f"!!! BROADCAST {broadcast_id} FAILED: {e} !!!")
+
+
+def start_broadcast(broadcast_id):
+    threading.Thread(target=run_broadcast, args=(broadcast_id,), name=f'broadcast-{broadcast_id[:8]}', daemon=True).start()
+
+
+def resume_stalled_broadcasts():
+    """Restarts running broadcasts whose sender stopped reporting (e.g. after a restart)."""
+    try:
+        with app.app_context():
+            now = datetime.now()
+            stale = (now - timedelta(seconds=BROADCAST_LEASE_SECONDS)).isoformat()
+            stalled = db.session.execute(
+                select(Broadcast.id).where(Broadcast.status == 'running', Broadcast.heartbeat_at < stale)
+            ).scalars().all()
+            for broadcast_id in stalled:
+                # Conditional claim, so only one process resumes it
+                claimed = db.session.execute(
+                    update(Broadcast)
+                    .where(Broadcast.id == broadcast_id, Broadcast.status == 'running', Broadcast.heartbeat_at < stale)
+                    .values(heartbeat_at=now.isoformat())
+                ).rowcount
+                db.session.commit()
+                if claimed:
+                    print(f"--- RESUMING BROADCAST {broadcast_id} ---")
+                    start_broadcast(broadcast_id)
+    except Exception as e:
+        print(f"!!! BROADCAST RESUME FAILED: {e} !!!")
 
+
+@app.route('/api/broadcasts', methods=['POST'])
+@login_required 
+def create_broadcast_route():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"status": "error", "message": "Request body must be a JSON object."}), 400
+    template = data.get('template')
+    template = template.strip() if isinstance(template, str) else ''
+    client_filter = data.get('filter') or {}
+    if not template:
+        return jsonify({"status": "error", "message": "Missing message template."}), 400
+    if not isinstance(client_filter, dict) or not client_filter:
+        # Required, so a missing filter never turns into a message to every client
+        return jsonify({"status": "error", "message": "A client filter object is required."}), 400
+    filter_error = broadcast_filter_error(client_filter)
+    if filter_error:
+        return jsonify({"status": "error", "message": filter_error}), 400
+
+    try:
+        broadcast = create_broadcast(template, client_filter)
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({"status": "error", "message": str(e)}), 400
     except Exception as e:
-        print(f"Network or API Call Exception: {e}")
-        return jsonify({"status": "error", "message": "Failed to connect to WhatsApp service."}), 500
+        db.session.rollback()
+        print(f"Error creating broadcast: {e}")
+        return jsonify({"status": "error", "message": "Failed to create broadcast."}), 500
+
+    if broadcast.status == 'running':
+        start_broadcast(broadcast.id)
+    return jsonify({
+        "status": "success",
+        "message": f"Broadcast to {broadcast.total} client(s) started.",
+        "broadcast": broadcast.to_dict(),
+        "status_url": url_for('get_broadcast', broadcast_id=broadcast.id),
+    }), 202
+
+
+@app.route('/api/broadcasts/<broadcast_id>', methods=['GET'])
+@login_required 
+def get_broadcast(broadcast_id):
+    broadcast = db.session.get(Broadcast, broadcast_id)
+    if broadcast is None:
+        return jsonify({"status": "error", "message": "Broadcast not found."}), 404
+    return jsonify(broadcast.to_dict())
+
+
+@app.route('/api/broadcasts/<broadcast_id>/recipients', methods=['GET'])
+@login_required 
+def get_broadcast_recipients(broadcast_id):
+    """Per-recipient results; ?status=failed lists the failures. Supports limit/after paging."""
+    query = select(*BROADCAST_RECIPIENT_COLUMNS).where(BroadcastRecipient.broadcast_id == broadcast_id)
+    status = request.args.get('status')
+    if status:
+        query = query.where(BroadcastRecipient.status == status)
+    try:
+        rows, next_cursor = paginate_query(query, BroadcastRecipient)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    return page_response([serialize_broadcast_recipient_row(row) for row in rows], next_cursor)
+
+
+# --- TWILIO STATUS CALLBACKS ---
+# Every message is sent with StatusCallback=TWILIO_STATUS_CALLBACK_URL. The webhook only
+# checks Twilio's signature and appends the update to an in-process buffer, so Twilio gets
+# its 204 straight away; a writer thread saves the buffer to message_log in one transaction
+# per batch and moves invoices whose message was delivered or read to 'Delivered'/'Read'.
+
+STATUS_FLUSH_SECONDS = 1
+STATUS_FLUSH_BATCH = 500  # flush early once this many updates are waiting
+# Invoice statuses a delivery update may advance, in order; callbacks can arrive out of order
+# and never move an invoice backwards (or touch one that is e.g. already 'Paid')
+INVOICE_DELIVERY_PROGRESS = ('Sent', 'Delivered', 'Read')
+INVOICE_STATUS_FOR_MESSAGE_STATUS = {'delivered': 'Delivered', 'read': 'Read'}
+
+
+class MessageLog(db.Model):
+    id = Column(Integer, primary_key=True)
+    message_sid = Column(String(64), nullable=False, index=True)
+    status = Column(String(20), nullable=False)  # queued, sent, delivered, read, failed, undelivered, ...
+    to_number = Column(String(50))
+    error_code = Column(String(20))
+    received_at = Column(String(50), nullable=False)
+
+
+_status_buffer = []
+_status_buffer_lock = threading.Lock()
+status_flush_wakeup = threading.Event()
+
+
+def buffer_status_update(update_row):
+    with _status_buffer_lock:
+        _status_buffer.append(update_row)
+        if len(_status_buffer) >= STATUS_FLUSH_BATCH:
+            status_flush_wakeup.set()
+
+
+def advance_invoice_statuses(latest):
+    """Applies {message sid: invoice status} to the invoices those messages were sent for."""
+    rows = db.session.execute(
+        select(OutboxMessage.twilio_sid, OutboxMessage.invoice_id)
+        .where(OutboxMessage.twilio_sid.in_(latest), OutboxMessage.invoice_id.is_not(None))
+    ).all()
+    for sid, invoice_id in rows:
+        invoice = db.session.get(Invoice, invoice_id)
+        new_status = latest[sid]
+        if (invoice is not None and invoice.status in INVOICE_DELIVERY_PROGRESS
+                and INVOICE_DELIVERY_PROGRESS.index(invoice.status) < INVOICE_DELIVERY_PROGRESS.index(new_status)):
+            invoice.status = new_status
+
+
+def flush_status_updates():
+    """Writes all buffered status updates in one transaction."""
+    with _status_buffer_lock:
+        batch = _status_buffer[:]
+        del _status_buffer[:]
+    if not batch:
+        return
+
+    with app.app_context():
+        try:
+            db.session.execute(insert(MessageLog), batch)
+            latest = {}
+            for row in batch:
+                invoice_status = INVOICE_STATUS_FOR_MESSAGE_STATUS.get(row['status'])
+                if invoice_status:
+                    sid = row['message_sid']
+                    latest[sid] = max(latest.get(sid, invoice_status), invoice_status, key=INVOICE_DELIVERY_PROGRESS.index)
+            if latest:
+                advance_invoice_statuses(latest)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            # Put the batch back so the next flush retries it
+            with _status_buffer_lock:
+                _status_buffer[:0] = batch
+            raise
+
+
+def run_status_log_writer():
+    while True:
+        status_flush_wakeup.wait(STATUS_FLUSH_SECONDS)
+        status_flush_wakeup.clear()
+        try:
+            flush_status_updates()
+        except Exception as e:
+            print(f"!!! MESSAGE LOG WRITE FAILED: {e} !!!")
+
+
+def start_status_log_writer():
+    threading.Thread(target=run_status_log_writer, name='status-log-writer', daemon=True).start()
+    # Write what is still buffered when the process exits normally
+    atexit.register(flush_status_updates)
+
+
+@app.route('/api/twilio/status', methods=['POST'])
+def twilio_status_callback():
+    """Twilio delivery status webhook (no login: authenticated by X-Twilio-Signature)."""
+    url = TWILIO_STATUS_CALLBACK_URL
+    if request.query_string:
+        url = f"{url}?{request.query_string.decode('utf-8')}"
+    if not twilio_client.validate_signature(url, request.form.items(multi=True), request.headers.get('X-Twilio-Signature')):
+        return jsonify({"status": "error", "message": "Invalid signature."}), 403
+
+    message_sid = request.form.get('MessageSid')
+    message_status = request.form.get('MessageStatus')
+    if not message_sid or not message_status:
+        return jsonify({"status": "error", "message": "Missing MessageSid or MessageStatus."}), 400
+
+    buffer_status_update({
+        'message_sid': message_sid,
+        'status': message_status,
+        'to_number': request.form.get('To'),
+        'error_code': request.form.get('ErrorCode'),
+        'received_at': datetime.now().isoformat(),
+    })
+    return '', 204
 
 
 # --- 10. DATABASE BACKUP AND MAINTENANCE FUNCTIONS ---
@@ -680,19 +2857,112 @@ def optimize_database():
         print(f"!!! DATABASE OPTIMIZATION FAILED: {e} !!!")
 
 
+def reconcile_stat_counters():
+    """
+    Recomputes the dashboard counters from scratch to correct any drift
+    (for example rows changed directly in the database).
+    """
+    try:
+        with app.app_context():
+            rebuild_stat_counters()
+            print("--- DASHBOARD COUNTERS RECONCILED ---")
+    except Exception as e:
+        print(f"!!! DASHBOARD COUNTER RECONCILE FAILED: {e} !!!")
+
+
+def purge_idempotency_keys():
+    """Deletes idempotency keys past their TTL."""
+    try:
+        with app.app_context():
+            result = db.session.execute(
+                delete(IdempotencyKey).where(IdempotencyKey.expires_at < datetime.now().isoformat())
+            )
+            db.session.commit()
+            if result.rowcount:
+                print(f"--- IDEMPOTENCY KEYS PURGED: {result.rowcount} ---")
+    except Exception as e:
+        print(f"!!! IDEMPOTENCY KEY PURGE FAILED: {e} !!!")
+
+
+def evict_pdf_cache():
+    """Keeps the PDF cache within its TTL and size cap."""
+    try:
+        evicted, expired = sweep_pdf_cache()
+        if evicted or expired:
+            print(f"--- PDF CACHE SWEEP: {expired} expired, {evicted} evicted ---")
+    except Exception as e:
+        print(f"!!! PDF CACHE SWEEP FAILED: {e} !!!")
+
+
 def schedule_jobs():
     """Sets up the automatic scheduler for maintenance tasks."""
     scheduler = BackgroundScheduler()
     scheduler.add_job(backup_database, 'cron', hour=2, minute=0, id='daily_backup')
     scheduler.add_job(optimize_database, 'cron', day_of_week='sun', hour=3, minute=0, id='weekly_optimization')
+    scheduler.add_job(reconcile_stat_counters, 'cron', hour=2, minute=30, id='daily_stats_reconcile')
+    scheduler.add_job(evict_pdf_cache, 'interval', minutes=PDF_CACHE_SWEEP_MINUTES, id='pdf_cache_sweep')
+    scheduler.add_job(purge_idempotency_keys, 'interval', hours=1, id='idempotency_key_purge')
+    scheduler.add_job(resume_stalled_broadcasts, 'interval', seconds=BROADCAST_LEASE_SECONDS, id='broadcast_resume',
+                      next_run_time=datetime.now())
     scheduler.start()
     print("--- Background Scheduler Started ---")
 
 
+# --- INDEX USAGE CHECK ---
+# 'flask --app app check-indexes' asks the database planner how it runs the hot queries
+# and fails if any of them would not use its index (e.g. a migration was not applied).
+
+def hot_queries():
+    """(description, statement, index expected in the plan) for each hot query."""
+    return [
+        ("pending clients", select(func.count(Client.id)).where(Client.status == 'Pending'), 'ix_client_status'),
+        ("high priority tasks", select(func.count(Task.id)).where(Task.priority == 'High'), 'ix_task_priority'),
+        ("tasks by assignee", task_list_select().where(Task.assigned_to == 'User'), 'ix_task_assigned_to'),
+        ("outstanding invoices",
+         select(func.count(Invoice.id)).where(Invoice.status.in_(OUTSTANDING_INVOICE_STATUSES)), 'ix_invoice_status'),
+        ("invoices by client", invoice_list_select().where(Invoice.client_id == 1), 'ix_invoice_client_id'),
+        ("invoices by date", invoice_list_select().where(Invoice.issue_date >= '2025-01-01'), 'ix_invoice_issue_date'),
+        ("line items by invoice",
+         select(*LINE_ITEM_COLUMNS).where(LineItem.invoice_id.in_([1, 2, 3])), 'ix_line_item_invoice_id'),
+    ]
+
+
+def explain(statement):
+    """Returns the query plan text for a statement on the configured database."""
+    dialect = db.engine.dialect
+    sql = str(statement.compile(dialect=dialect, compile_kwargs={'literal_binds': True}))
+    if dialect.name == 'sqlite':
+        rows = db.session.execute(text(f"EXPLAIN QUERY PLAN {sql}")).all()
+        return '\n'.join(str(row[-1]) for row in rows)
+    # On tiny tables Postgres prefers sequential scans; disable them so the check
+    # reports whether an index is usable rather than whether it is cheaper today.
+    db.session.execute(text("SET LOCAL enable_seqscan = off"))
+    rows = db.session.execute(text(f"EXPLAIN {sql}")).all()
+    return '\n'.join(row[0] for row in rows)
+
+
+@app.cli.command('check-indexes')
+def check_indexes():
+    """Verifies that every hot query is planned with its index."""
+    failures = 0
+    for description, statement, index_name in hot_queries():
+        plan = explain(statement)
+        uses_index = index_name in plan
+        failures += not uses_index
+        print(f"{'OK  ' if uses_index else 'FAIL'} {description:<24} {index_name}")
+        if not uses_index:
+            print(f"     plan: {plan}")
+    db.session.rollback()
+    if failures:
+        raise SystemExit(1)
+
+
 # --- EXECUTION FLOW ---
 
 initialize_database()
 
 # Start the background tasks
 with app.app_context(): 
-    schedule_jobs()
\ No newline at end of file
+    schedule_jobs()
+start_outbox_sender()
+start_status_log_writer()
\ No newline at end of file
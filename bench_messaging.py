@@ -0,0 +1,170 @@
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import requests
+
+# ----------------------------------------------------------------------
+# BENCHMARK: WhatsApp messaging path against the local mock Twilio (mock_twilio.py).
+# Runs against a throwaway SQLite database so app.db is never touched, and starts the
+# mock server in its own process so it does not compete with the app for the GIL.
+# Usage: python bench_messaging.py [--messages 500] [--broadcast 2000] [--latency 0.1]
+#                                  [--error-rate 0] [--rate-limit-rate 0]
+#                                  [--min-throughput MSG_PER_S] [--max-p99-ms MS]
+# Exits non-zero when a --min-throughput / --max-p99-ms budget is missed.
+# ----------------------------------------------------------------------
+
+BENCH_DB = os.path.join(tempfile.mkdtemp(), 'bench.db')
+PHONE_PREFIX = '+1555'
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Messaging throughput and latency benchmark.")
+    parser.add_argument('--messages', type=int, default=500, help="messages sent through /api/send_whatsapp")
+    parser.add_argument('--broadcast', type=int, default=2000, help="broadcast recipients (0 to skip)")
+    parser.add_argument('--latency', type=float, default=0.1)
+    parser.add_argument('--jitter', type=float, default=0.05)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0)
+    parser.add_argument('--timeout', type=float, default=600, help="seconds to wait for each phase")
+    parser.add_argument('--min-throughput', type=float, help="fail below this many delivered messages/s")
+    parser.add_argument('--max-p99-ms', type=float, help="fail if the p99 API latency exceeds this")
+    return parser.parse_args()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_mock(args, port):
+    command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mock_twilio.py'),
+               '--port', str(port), '--latency', str(args.latency), '--jitter', str(args.jitter),
+               '--error-rate', str(args.error_rate), '--rate-limit-rate', str(args.rate_limit_rate)]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(100):
+        try:
+            requests.get(f'http://127.0.0.1:{port}/stats', timeout=1)
+            return process
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    process.kill()
+    sys.exit("mock Twilio server did not start")
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+
+def latency_line(label, seconds):
+    return (f"{label:<22} p50 {percentile(seconds, 0.5) * 1000:8.1f} ms   p95 {percentile(seconds, 0.95) * 1000:8.1f} ms   "
+            f"p99 {percentile(seconds, 0.99) * 1000:8.1f} ms   max {max(seconds, default=0) * 1000:8.1f} ms")
+
+
+def wait_until(condition, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.2)
+    return False
+
+
+def bench_send_path(app, db, OutboxMessage, client, args):
+    """Posts --messages sends, then waits for the outbox to deliver (or give up on) all of them."""
+    api_latencies = []
+    start = time.perf_counter()
+    for n in range(args.messages):
+        request_start = time.perf_counter()
+        response = client.post('/api/send_whatsapp', json={'phone': f'{PHONE_PREFIX}{n:07d}', 'message': f'Bench {n}'})
+        api_latencies.append(time.perf_counter() - request_start)
+        assert response.status_code == 202, response.get_data(as_text=True)
+    api_elapsed = time.perf_counter() - start
+
+    def settled():
+        # Delivered, failed for good, or waiting for a later retry
+        with app.app_context():
+            return not db.session.execute(
+                db.select(db.func.count(OutboxMessage.id))
+                .where((OutboxMessage.status == 'sending') |
+                       ((OutboxMessage.status == 'queued') & (OutboxMessage.attempts == 0)))
+            ).scalar()
+    if not wait_until(settled, args.timeout):
+        print("!!! outbox did not settle before --timeout !!!")
+
+    with app.app_context():
+        messages = db.session.execute(db.select(OutboxMessage)).scalars().all()
+    sent = [m for m in messages if m.status == 'sent']
+    end_to_end = [(datetime.fromisoformat(m.sent_at) - datetime.fromisoformat(m.created_at)).total_seconds() for m in sent]
+    delivered_elapsed = max((datetime.fromisoformat(m.sent_at) for m in sent), default=None)
+    first_created = min((datetime.fromisoformat(m.created_at) for m in messages), default=None)
+    throughput = len(sent) / (delivered_elapsed - first_created).total_seconds() if sent else 0.0
+
+    print(f"--- send path: {args.messages} messages ---")
+    print(f"API accepted {args.messages / api_elapsed:9.1f} req/s")
+    print(latency_line('API latency', api_latencies))
+    print(latency_line('enqueue -> Twilio 201', end_to_end))
+    print(f"delivered    {throughput:9.1f} msg/s   sent {len(sent)}   failed "
+          f"{sum(m.status == 'failed' for m in messages)}   retry scheduled {sum(m.status == 'queued' for m in messages)}")
+    return throughput, percentile(api_latencies, 0.99)
+
+
+def bench_broadcast(app, db, Client, client, args):
+    with app.app_context():
+        db.session.execute(Client.__table__.insert(), [
+            {'name': f'Bench {n}', 'status': 'Bench', 'phone': f'{PHONE_PREFIX}{n:07d}'} for n in range(args.broadcast)
+        ])
+        db.session.commit()
+
+    start = time.perf_counter()
+    response = client.post('/api/broadcasts', json={'filter': {'status': 'Bench'}, 'template': 'Hello {name}'})
+    assert response.status_code == 202, response.get_data(as_text=True)
+    status_url = response.get_json()['status_url']
+    progress = {}
+
+    def finished():
+        progress.update(client.get(status_url).get_json())
+        return progress['status'] == 'done'
+    if not wait_until(finished, args.timeout):
+        print("!!! broadcast did not finish before --timeout !!!")
+    elapsed = time.perf_counter() - start
+
+    print(f"--- broadcast: {args.broadcast} recipients ---")
+    print(f"finished in {elapsed:.1f}s   {progress['sent'] / elapsed:9.1f} msg/s   "
+          f"sent {progress['sent']}   failed {progress['failed']}   pending {progress['pending']}")
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    port = free_port()
+    mock = start_mock(args, port)
+    try:
+        os.environ['DATABASE_URL'] = f'sqlite:///{BENCH_DB}'
+        os.environ['TWILIO_API_BASE'] = f'http://127.0.0.1:{port}/2010-04-01'
+        from app import app, db, Client, OutboxMessage
+
+        client = app.test_client()
+        login = client.post('/login', json={'username': 'admin', 'password': '12345'})
+        assert login.status_code == 200, "benchmark needs the default admin user"
+
+        throughput, p99 = bench_send_path(app, db, OutboxMessage, client, args)
+        if args.broadcast:
+            bench_broadcast(app, db, Client, client, args)
+        print("mock Twilio:", requests.get(f'http://127.0.0.1:{port}/stats', timeout=5).json())
+    finally:
+        mock.terminate()
+
+    failures = []
+    if args.min_throughput is not None and throughput < args.min_throughput:
+        failures.append(f"delivered {throughput:.1f} msg/s < {args.min_throughput}")
+    if args.max_p99_ms is not None and p99 * 1000 > args.max_p99_ms:
+        failures.append(f"API p99 {p99 * 1000:.1f} ms > {args.max_p99_ms}")
+    if failures:
+        sys.exit("REGRESSION: " + "; ".join(failures))
@@ -0,0 +1,81 @@
+import io
+import sys
+import time
+import tracemalloc
+
+from invoice_pdf import render_invoice_pdf_platypus, render_invoice_pdf_fast
+
+# ----------------------------------------------------------------------
+# BENCHMARK: platypus vs. canvas ("fast") invoice PDF rendering.
+# Renders in memory only; no database or Flask app is involved.
+# Usage: python bench_pdf.py [line item counts...]   (default: 10 1000 10000)
+#        python bench_pdf.py --stress                 (50k line items, checks scaling)
+# ----------------------------------------------------------------------
+
+STRESS_BASE = 5000
+STRESS_SIZE = 50000
+# Per-item time and memory at STRESS_SIZE may be at most this many times the STRESS_BASE figure
+STRESS_MAX_GROWTH = 2.0
+
+
+def make_snapshot(line_item_count):
+    return {
+        'id': 1,
+        'invoice_number': f'BENCH-{line_item_count}',
+        'client_name': 'Benchmark Client',
+        'issue_date': '2025-01-01',
+        'due_date': '2025-02-01',
+        'total_amount': f'{line_item_count * 12.5:.2f}',
+        'line_items': [[f'Service item {n}', 1, '12.50', '12.50'] for n in range(line_item_count)],
+    }
+
+
+def measure(renderer, snapshot):
+    """Returns (seconds, peak traced memory in MiB, PDF size in KiB) for one render."""
+    # Timed and memory-traced separately: tracemalloc slows allocation-heavy code a lot
+    output = io.BytesIO()
+    start = time.perf_counter()
+    renderer(snapshot, output)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    renderer(snapshot, io.BytesIO())
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / (1024 * 1024), len(output.getvalue()) / 1024
+
+
+RENDERERS = (('platypus', render_invoice_pdf_platypus), ('fast', render_invoice_pdf_fast))
+
+
+def stress():
+    """
+    Renders STRESS_SIZE line items with each renderer and fails if time or memory per line
+    item grew by more than STRESS_MAX_GROWTH compared to a STRESS_BASE item invoice.
+    """
+    failures = []
+    for name, renderer in RENDERERS:
+        base_time, base_peak, _ = measure(renderer, make_snapshot(STRESS_BASE))
+        elapsed, peak, pdf_size = measure(renderer, make_snapshot(STRESS_SIZE))
+        time_growth = (elapsed / STRESS_SIZE) / (base_time / STRESS_BASE)
+        memory_growth = (peak / STRESS_SIZE) / (base_peak / STRESS_BASE)
+        print(f"{name:<9} {STRESS_SIZE} items: {elapsed:.2f}s, peak {peak:.1f} MiB, {pdf_size:.0f} KiB "
+              f"(per-item growth vs {STRESS_BASE}: time x{time_growth:.2f}, memory x{memory_growth:.2f})")
+        if time_growth > STRESS_MAX_GROWTH or memory_growth > STRESS_MAX_GROWTH:
+            failures.append(name)
+    if failures:
+        sys.exit(f"superlinear rendering: {', '.join(failures)}")
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] == ['--stress']:
+        stress()
+        sys.exit()
+
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10, 1000, 10000]
+    print(f"{'items':>7} {'renderer':<9} {'time (s)':>9} {'peak MiB':>9} {'size KiB':>9}")
+    for size in sizes:
+        snapshot = make_snapshot(size)
+        for name, renderer in RENDERERS:
+            elapsed, peak, pdf_size = measure(renderer, snapshot)
+            print(f"{size:>7} {name:<9} {elapsed:>9.3f} {peak:>9.1f} {pdf_size:>9.0f}")
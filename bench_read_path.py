@@ -0,0 +1,80 @@
+import os
+import sys
+import tempfile
+import time
+
+from sqlalchemy.orm import joinedload, selectinload
+
+# ----------------------------------------------------------------------
+# BENCHMARK: ORM to_dict() list serialization vs. the Core fast read path.
+# Runs against a throwaway SQLite database so app.db is never touched.
+# Usage: python bench_read_path.py [rows]
+# ----------------------------------------------------------------------
+
+BENCH_DB = os.path.join(tempfile.mkdtemp(), 'bench.db')
+os.environ['DATABASE_URL'] = f'sqlite:///{BENCH_DB}'
+
+from app import (app, db, Client, Task, Invoice, LineItem,
+                 client_list_select, task_list_select, invoice_list_select,
+                 serialize_clients, serialize_tasks, serialize_invoices)
+
+ROWS = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+LINE_ITEMS_PER_INVOICE = 3
+REPEATS = 3
+
+
+def populate():
+    """Bulk inserts ROWS clients, tasks and invoices (with line items)."""
+    db.session.execute(Client.__table__.insert(), [
+        {'name': f'Client {i}', 'status': 'Pending' if i % 3 else 'Active', 'phone': f'+1415555{i:04d}'}
+        for i in range(ROWS)
+    ])
+    db.session.execute(Task.__table__.insert(), [
+        {'name': f'Task {i}', 'due_date': '2025-12-31', 'priority': 'High' if i % 4 else 'Low', 'assigned_to': 'User'}
+        for i in range(ROWS)
+    ])
+    db.session.execute(Invoice.__table__.insert(), [
+        {'invoice_number': f'BENCH-{i}', 'client_id': 1 + i % ROWS, 'issue_date': '2025-01-01',
+         'due_date': '2025-02-01', 'total_amount': '30.00', 'status': 'Draft'}
+        for i in range(ROWS)
+    ])
+    invoice_ids = [row[0] for row in db.session.execute(db.select(Invoice.id))]
+    db.session.execute(LineItem.__table__.insert(), [
+        {'invoice_id': invoice_id, 'description': f'Item {n}', 'quantity': 1, 'unit_price': '10.00', 'subtotal': '10.00'}
+        for invoice_id in invoice_ids for n in range(LINE_ITEMS_PER_INVOICE)
+    ])
+    db.session.commit()
+
+
+def best_of(fn):
+    timings = []
+    for _ in range(REPEATS):
+        db.session.expunge_all()
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def run_case(name, orm_fn, fast_fn):
+    orm_time, orm_result = best_of(orm_fn)
+    fast_time, fast_result = best_of(fast_fn)
+    assert orm_result == fast_result, f"{name}: fast path output differs from to_dict()"
+    print(f"{name:<10} orm {orm_time * 1000:9.1f} ms   fast {fast_time * 1000:9.1f} ms   "
+          f"speedup {orm_time / fast_time:5.1f}x")
+
+
+if __name__ == '__main__':
+    with app.app_context():
+        populate()
+        print(f"--- {ROWS} rows per table, best of {REPEATS} ---")
+        run_case('clients',
+                 lambda: [c.to_dict() for c in Client.query.order_by(Client.id)],
+                 lambda: serialize_clients(db.session.execute(client_list_select().order_by(Client.id))))
+        run_case('tasks',
+                 lambda: [t.to_dict() for t in Task.query.order_by(Task.id)],
+                 lambda: serialize_tasks(db.session.execute(task_list_select().order_by(Task.id))))
+        run_case('invoices',
+                 lambda: [i.to_dict() for i in Invoice.query.options(joinedload(Invoice.client), selectinload(Invoice.line_items))
+                                                  .order_by(Invoice.id)],
+                 lambda: serialize_invoices(db.session.execute(invoice_list_select().order_by(Invoice.id)).all()))
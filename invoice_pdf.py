@@ -0,0 +1,362 @@
+import io
+import os
+import glob
+import hashlib
+import json
+from decimal import Decimal
+from functools import lru_cache
+
+from reportlab.lib.pagesizes import letter
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, PageBreak
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.lib import colors
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen import canvas
+
+# ----------------------------------------------------------------------
+# INVOICE PDF RENDERING
+# This module has no Flask or database imports: it renders from a plain
+# "snapshot" dict (see app.invoice_snapshot), so it can run inside the
+# worker processes of the PDF render pool without loading the web app.
+#
+# Snapshot layout:
+#   {'id': 1, 'invoice_number': 'INV-1', 'client_name': 'Alice',
+#    'issue_date': '2025-01-01', 'due_date': '2025-02-01', 'total_amount': '12.50',
+#    'line_items': [[description, quantity, unit_price, subtotal], ...]}
+#
+# Both renderers lay the line items out one page at a time: every page has its own table
+# with the column header repeated, and invoices that run over several pages get a
+# subtotal row at the bottom of each page. No step of the layout grows with the total
+# number of line items, so large invoices render in linear time.
+# ----------------------------------------------------------------------
+
+# Bump when the PDF layout changes so previously cached files are regenerated
+PDF_LAYOUT_VERSION = 3
+
+# --- STATIC LAYOUT (built once per process) ---
+
+STYLES = getSampleStyleSheet()
+
+COL_WIDTHS = (250, 50, 80, 80)
+TABLE_HEADER = ('Description', 'Qty', 'Unit Price', 'Subtotal')
+
+SUBTOTAL_FILL = colors.lightgrey
+
+TABLE_BASE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black),
+    ('ALIGN', (1, 0), (-1, -1), 'RIGHT'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+])
+
+# Last page: ends with the total row
+LINE_ITEM_TABLE_STYLE = TableStyle([
+    ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+    ('BACKGROUND', (0, -1), (-1, -1), colors.yellow), # Highlight total row
+], parent=TABLE_BASE_STYLE)
+
+# Other pages of a multi-page invoice: end with the page subtotal row
+PAGE_TABLE_STYLE = TableStyle([
+    ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+    ('BACKGROUND', (0, -1), (-1, -1), SUBTOTAL_FILL),
+], parent=TABLE_BASE_STYLE)
+
+# Last page of a multi-page invoice: page subtotal, then total
+LAST_PAGE_TABLE_STYLE = TableStyle([
+    ('FONTNAME', (0, -2), (-1, -2), 'Helvetica-Bold'),
+    ('BACKGROUND', (0, -2), (-1, -2), SUBTOTAL_FILL),
+], parent=LINE_ITEM_TABLE_STYLE)
+
+# Platypus table metrics (Table defaults for a 10pt font) used to plan page breaks
+FRAME_PADDING = 6
+CELL_LEADING = 12
+CELL_VERTICAL_PADDING = 6
+
+# Canvas renderer geometry, matching the platypus layout on a letter page
+PAGE_WIDTH, PAGE_HEIGHT = letter
+MARGIN = 72
+TABLE_WIDTH = sum(COL_WIDTHS)
+TABLE_LEFT = MARGIN + (PAGE_WIDTH - 2 * MARGIN - TABLE_WIDTH) / 2
+COLUMN_EDGES = tuple(TABLE_LEFT + sum(COL_WIDTHS[:i]) for i in range(len(COL_WIDTHS) + 1))
+ROW_HEIGHT = 18
+CELL_PADDING = 6
+FONT_SIZE = 10
+BASELINE_OFFSET = (ROW_HEIGHT - FONT_SIZE) / 2 + 2
+
+
+def invoice_content_hash(snapshot):
+    """SHA-256 over the invoice fields and line items that appear on the PDF."""
+    payload = dict(snapshot, layout=PDF_LAYOUT_VERSION)
+    payload.pop('id', None)
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def invoice_pdf_filename(snapshot):
+    """Cache file name: changes whenever anything printed on the invoice changes."""
+    return f"invoice_{snapshot['id']}_{invoice_content_hash(snapshot)[:16]}.pdf"
+
+
+def remove_invoice_pdfs(pdf_dir, invoice_id, keep=None):
+    """Deletes cached PDFs of an invoice, except the file named `keep`."""
+    for path in glob.glob(os.path.join(pdf_dir, f"invoice_{invoice_id}_*.pdf")):
+        if os.path.basename(path) != keep:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def render_invoice_pdf(snapshot, output):
+    """
+    Renders the invoice into `output` (a file path or a writable binary file object).
+    Simple invoices are drawn directly on a canvas; anything the canvas renderer
+    cannot lay out (multi-line or over-long descriptions) goes through platypus.
+    """
+    if is_simple_invoice(snapshot):
+        render_invoice_pdf_fast(snapshot, output)
+    else:
+        render_invoice_pdf_platypus(snapshot, output)
+
+
+def is_simple_invoice(snapshot):
+    """True when every line item fits on a single table row."""
+    max_width = COL_WIDTHS[0] - 2 * CELL_PADDING
+    for description, _, _, _ in snapshot['line_items']:
+        if '\n' in description or stringWidth(description, 'Helvetica', FONT_SIZE) > max_width:
+            return False
+    return True
+
+
+def subtotal_row(amount):
+    return ('', '', 'Page subtotal:', f"${amount}")
+
+
+def total_row(snapshot):
+    return ('', '', 'TOTAL AMOUNT:', f"${snapshot['total_amount']}")
+
+
+def paginate_line_items(line_items, first_page_height, page_height, row_height):
+    """
+    Yields the line items one page at a time, packing rows by height (row_height(item))
+    while leaving room on each page for the column header, page subtotal and total rows.
+    """
+    reserved = 3 * ROW_HEIGHT
+    page, available = [], first_page_height - reserved
+    for item in line_items:
+        height = row_height(item)
+        if page and height > available:
+            yield page
+            page, available = [], page_height - reserved
+        page.append(item)
+        available -= height
+    yield page
+
+
+def split_tall_line_items(line_items, max_lines):
+    """
+    Spreads any description of more than max_lines lines over several rows, since platypus
+    cannot split a single row across pages. Continuation rows have None for the quantity,
+    unit price and subtotal.
+    """
+    for item in line_items:
+        lines = item[0].split('\n')
+        if len(lines) <= max_lines:
+            yield item
+            continue
+        yield ['\n'.join(lines[:max_lines]), *item[1:]]
+        for start in range(max_lines, len(lines), max_lines):
+            yield ['\n'.join(lines[start:start + max_lines]), None, None, None]
+
+
+def _platypus_row_height(item):
+    return CELL_VERTICAL_PADDING + CELL_LEADING * (item[0].count('\n') + 1)
+
+
+def render_invoice_pdf_platypus(snapshot, output):
+    """Flowable-based renderer: slower, but handles any content."""
+    # 1. Setup PDF Document
+    doc = SimpleDocTemplate(output, pagesize=letter)
+    Story = []
+
+    # 2. Header and Client Info
+    Story.append(Paragraph(f"<b>INVOICE #{snapshot['invoice_number']}</b>", STYLES['h1']))
+    Story.append(Paragraph(f"<b>Client:</b> {snapshot['client_name']}", STYLES['Normal']))
+    Story.append(Paragraph(f"<b>Issue Date:</b> {snapshot['issue_date']}", STYLES['Normal']))
+    Story.append(Paragraph(f"<b>Due Date:</b> {snapshot['due_date']}", STYLES['Normal']))
+    Story.append(Paragraph(f"<b>Total Due:</b> ${snapshot['total_amount']}", STYLES['h2']))
+    Story.append(Paragraph("<br/>", STYLES['Normal']))
+
+    # 3. One line item table per page, so no table ever has to be split by platypus
+    page_height = doc.height - 2 * FRAME_PADDING
+    header_height = sum(flowable.wrap(doc.width, page_height)[1] + flowable.getSpaceBefore() + flowable.getSpaceAfter()
+                        for flowable in Story)
+    # The first page has the least room, so a row that fits there fits on any page
+    first_page_height = page_height - header_height
+    max_lines = max(1, int((first_page_height - 3 * ROW_HEIGHT - CELL_VERTICAL_PADDING) // CELL_LEADING))
+    line_items = split_tall_line_items(snapshot['line_items'], max_lines)
+    pages = list(paginate_line_items(line_items, first_page_height, page_height, _platypus_row_height))
+
+    for page_number, page in enumerate(pages, start=1):
+        table_data = [TABLE_HEADER]
+        page_subtotal = Decimal('0.00')
+        for description, quantity, unit_price, subtotal in page:
+            if quantity is None:  # rest of the description above
+                table_data.append((description, '', '', ''))
+                continue
+            table_data.append((description, str(quantity), f"${unit_price}", f"${subtotal}"))
+            page_subtotal += Decimal(subtotal)
+
+        if len(pages) > 1:
+            table_data.append(subtotal_row(page_subtotal))
+        if page_number == len(pages):
+            table_data.append(total_row(snapshot))
+            style = LAST_PAGE_TABLE_STYLE if len(pages) > 1 else LINE_ITEM_TABLE_STYLE
+        else:
+            style = PAGE_TABLE_STYLE
+
+        table = Table(table_data, colWidths=COL_WIDTHS)
+        table.setStyle(style)
+        Story.append(table)
+        if page_number < len(pages):
+            Story.append(PageBreak())
+
+    # 4. Build the PDF
+    doc.build(Story)
+
+
+def _draw_header_block(pdf, snapshot):
+    """Draws the invoice title and details; returns the y position below them."""
+    y = PAGE_HEIGHT - MARGIN - 18
+    pdf.setFont('Helvetica-Bold', 18)
+    pdf.drawString(MARGIN, y, f"INVOICE #{snapshot['invoice_number']}")
+    y -= 30
+    for label, value in (('Client:', snapshot['client_name']),
+                         ('Issue Date:', snapshot['issue_date']),
+                         ('Due Date:', snapshot['due_date'])):
+        pdf.setFont('Helvetica-Bold', FONT_SIZE)
+        pdf.drawString(MARGIN, y, label)
+        pdf.setFont('Helvetica', FONT_SIZE)
+        pdf.drawString(MARGIN + stringWidth(label + ' ', 'Helvetica-Bold', FONT_SIZE), y, str(value))
+        y -= 12
+    y -= 12
+    pdf.setFont('Helvetica-Bold', 14)
+    pdf.drawString(MARGIN, y, f"Total Due: ${snapshot['total_amount']}")
+    return y - 30
+
+
+@lru_cache(maxsize=4096)
+def _text_width(value, font):
+    """Cached stringWidth: quantities and amounts repeat a lot across line items."""
+    return stringWidth(value, font, FONT_SIZE)
+
+
+def _add_row_text(text, top, cells, font):
+    """Adds one row's cell text to a text object: first column left, the rest right aligned."""
+    baseline = top - ROW_HEIGHT + BASELINE_OFFSET
+    text.setTextOrigin(COLUMN_EDGES[0] + CELL_PADDING, baseline)
+    text.textOut(cells[0])
+    for index in range(1, len(cells)):
+        x = COLUMN_EDGES[index + 1] - CELL_PADDING - _text_width(cells[index], font)
+        text.setTextOrigin(x, baseline)
+        text.textOut(cells[index])
+
+
+def _draw_filled_row(pdf, top, cells, fill):
+    """Draws a bold row on a coloured background (column header and total rows)."""
+    pdf.setFillColor(fill)
+    pdf.rect(TABLE_LEFT, top - ROW_HEIGHT, TABLE_WIDTH, ROW_HEIGHT, stroke=0, fill=1)
+    pdf.setFillColor(colors.black)
+    text = pdf.beginText()
+    text.setFont('Helvetica-Bold', FONT_SIZE)
+    _add_row_text(text, top, cells, 'Helvetica-Bold')
+    pdf.drawText(text)
+    return top - ROW_HEIGHT
+
+
+def _draw_grid(pdf, top, bottom):
+    """Strokes the borders of every row between top and bottom as a single path."""
+    path = pdf.beginPath()
+    y = top
+    while y >= bottom - 0.5:
+        path.moveTo(TABLE_LEFT, y)
+        path.lineTo(TABLE_LEFT + TABLE_WIDTH, y)
+        y -= ROW_HEIGHT
+    for edge in COLUMN_EDGES:
+        path.moveTo(edge, top)
+        path.lineTo(edge, bottom)
+    pdf.drawPath(path, stroke=1, fill=0)
+
+
+def render_invoice_pdf_fast(snapshot, output):
+    """
+    Canvas renderer for invoices whose line items each fit on one row. Each page gets one
+    text object for its rows and one path for its grid, and is finished before the next
+    one is started.
+    """
+    pdf = canvas.Canvas(output, pagesize=letter)
+    table_top = _draw_header_block(pdf, snapshot)
+    pages = paginate_line_items(snapshot['line_items'], table_top - MARGIN, PAGE_HEIGHT - 2 * MARGIN,
+                                lambda item: ROW_HEIGHT)
+
+    page, page_number = next(pages), 1
+    while True:
+        next_page = next(pages, None)
+        pdf.setLineWidth(1)
+        top = _draw_filled_row(pdf, table_top, TABLE_HEADER, colors.grey)
+
+        text = pdf.beginText()
+        text.setFont('Helvetica', FONT_SIZE)
+        page_subtotal = Decimal('0.00')
+        for description, quantity, unit_price, subtotal in page:
+            _add_row_text(text, top, (description, str(quantity), f"${unit_price}", f"${subtotal}"), 'Helvetica')
+            page_subtotal += Decimal(subtotal)
+            top -= ROW_HEIGHT
+        pdf.drawText(text)
+
+        if next_page is not None or page_number > 1:
+            top = _draw_filled_row(pdf, top, subtotal_row(page_subtotal), SUBTOTAL_FILL)
+        if next_page is None:
+            top = _draw_filled_row(pdf, top, total_row(snapshot), colors.yellow)
+        _draw_grid(pdf, table_top, top)
+        pdf.showPage()
+
+        if next_page is None:
+            break
+        page, page_number = next_page, page_number + 1
+        table_top = PAGE_HEIGHT - MARGIN
+
+    pdf.save()
+
+
+def render_invoice_pdf_bytes(snapshot):
+    """Renders the invoice into an in-memory buffer and returns the PDF bytes."""
+    buffer = io.BytesIO()
+    render_invoice_pdf(snapshot, buffer)
+    return buffer.getvalue()
+
+
+def write_invoice_pdf(snapshot, pdf_dir):
+    """
+    Writes the invoice PDF into pdf_dir, or reuses the cached file if the invoice has
+    not changed since it was last rendered. Returns the path to the PDF file.
+    """
+    os.makedirs(pdf_dir, exist_ok=True)
+
+    pdf_filename = invoice_pdf_filename(snapshot)
+    pdf_path = os.path.join(pdf_dir, pdf_filename)
+    if os.path.exists(pdf_path):
+        return pdf_path
+
+    # Render to a private temporary file and rename it into place, so a concurrent
+    # render never exposes a half-written PDF
+    tmp_path = f"{pdf_path}.{os.getpid()}.tmp"
+    try:
+        render_invoice_pdf(snapshot, tmp_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, pdf_path)
+    remove_invoice_pdfs(pdf_dir, snapshot['id'], keep=pdf_filename)
+
+    return pdf_path
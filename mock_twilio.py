@@ -0,0 +1,127 @@
+import argparse
+import asyncio
+import random
+import time
+import uuid
+from datetime import datetime, timezone
+
+import aiohttp
+from aiohttp import web
+
+from twilio_client import twilio_signature
+
+# ----------------------------------------------------------------------
+# MOCK TWILIO SERVER: a local stand-in for the Messages.json endpoint, for load tests.
+# Point the app at it with TWILIO_API_BASE=http://127.0.0.1:8099/2010-04-01
+# Usage: python mock_twilio.py [--port 8099] [--latency 0.1] [--jitter 0.05]
+#                              [--error-rate 0.01] [--rate-limit-rate 0.02] [--retry-after 1]
+#                              [--callbacks --auth-token TOKEN]
+# GET /stats returns request counters and latencies; POST /stats/reset clears them.
+# ----------------------------------------------------------------------
+
+MESSAGES_PATH = '/2010-04-01/Accounts/{account_sid}/Messages.json'
+
+
+def twilio_error(status, code, message, headers=None):
+    return web.json_response({'code': code, 'message': message, 'status': status}, status=status, headers=headers)
+
+
+def new_stats():
+    return {'requests': 0, 'accepted': 0, 'rate_limited': 0, 'errors': 0, 'rejected': 0,
+            'callbacks_sent': 0, 'callbacks_failed': 0, 'started_at': time.time()}
+
+
+def create_app(latency=0.1, jitter=0.0, error_rate=0.0, rate_limit_rate=0.0, retry_after=1,
+               callbacks=False, auth_token=''):
+    """
+    Builds the mock server. Each request waits latency + uniform(0, jitter) seconds, then
+    fails with a 429 (rate_limit_rate) or a 500 (error_rate), or is accepted. With callbacks,
+    accepted messages get signed 'sent' and 'delivered' status callbacks.
+    """
+    app = web.Application()
+    app['stats'] = new_stats()
+
+    async def post_status_callbacks(url, form):
+        async with aiohttp.ClientSession() as session:
+            for status in ('sent', 'delivered'):
+                await asyncio.sleep(latency)
+                params = {'MessageSid': form['sid'], 'MessageStatus': status, 'To': form['to'],
+                          'From': form['from'], 'AccountSid': form['account_sid']}
+                headers = {'X-Twilio-Signature': twilio_signature(auth_token, url, params.items())}
+                try:
+                    async with session.post(url, data=params, headers=headers) as response:
+                        ok = response.status < 300
+                except aiohttp.ClientError:
+                    ok = False
+                app['stats']['callbacks_sent' if ok else 'callbacks_failed'] += 1
+
+    async def create_message(request):
+        stats = request.app['stats']
+        stats['requests'] += 1
+        form = await request.post()
+        await asyncio.sleep(latency + random.uniform(0, jitter))
+
+        roll = random.random()
+        if roll < rate_limit_rate:
+            stats['rate_limited'] += 1
+            return twilio_error(429, 20429, 'Too Many Requests', headers={'Retry-After': str(retry_after)})
+        if roll < rate_limit_rate + error_rate:
+            stats['errors'] += 1
+            return twilio_error(500, 20500, 'Internal Server Error')
+        if not form.get('To') or not form.get('From') or not (form.get('Body') or form.get('MediaUrl')):
+            stats['rejected'] += 1
+            return twilio_error(400, 21602, 'Message body is required.')
+
+        stats['accepted'] += 1
+        message = {
+            'sid': 'SM' + uuid.uuid4().hex,
+            'account_sid': request.match_info['account_sid'],
+            'to': form['To'],
+            'from': form['From'],
+            'body': form.get('Body', ''),
+            'num_media': '1' if form.get('MediaUrl') else '0',
+            'status': 'queued',
+            'date_created': datetime.now(timezone.utc).strftime('%a, %d %b %Y %H:%M:%S +0000'),
+        }
+        if callbacks and form.get('StatusCallback'):
+            asyncio.create_task(post_status_callbacks(form['StatusCallback'], message))
+        return web.json_response(message, status=201)
+
+    async def get_stats(request):
+        stats = dict(request.app['stats'])
+        elapsed = time.time() - stats.pop('started_at')
+        stats['elapsed_seconds'] = round(elapsed, 3)
+        stats['requests_per_second'] = round(stats['requests'] / elapsed, 1) if elapsed else None
+        return web.json_response(stats)
+
+    async def reset_stats(request):
+        request.app['stats'] = new_stats()
+        return web.json_response({'status': 'reset'})
+
+    app.router.add_post(MESSAGES_PATH, create_message)
+    app.router.add_get('/stats', get_stats)
+    app.router.add_post('/stats/reset', reset_stats)
+    return app
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Local stand-in for Twilio's Messages.json endpoint.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--latency', type=float, default=0.1, help="seconds added to every response")
+    parser.add_argument('--jitter', type=float, default=0.0, help="extra random latency, up to this many seconds")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of requests answered with 500")
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help="fraction of requests answered with 429")
+    parser.add_argument('--retry-after', type=float, default=1, help="Retry-After seconds sent with 429s")
+    parser.add_argument('--callbacks', action='store_true', help="post signed status callbacks for accepted messages")
+    parser.add_argument('--auth-token', default='', help="token used to sign status callbacks")
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    web.run_app(
+        create_app(args.latency, args.jitter, args.error_rate, args.rate_limit_rate, args.retry_after,
+                   args.callbacks, args.auth_token),
+        host=args.host, port=args.port,
+    )
@@ -0,0 +1,94 @@
+import os
+import tempfile
+import threading
+
+from sqlalchemy import event
+
+# ----------------------------------------------------------------------
+# CHECK: GET /api/invoices runs the same, small number of queries however many
+# invoices (and line items) exist, i.e. no N+1 loading in the list endpoint.
+# Runs against a throwaway SQLite database so app.db is never touched.
+# Usage: python test_invoice_queries.py   (or: python -m pytest test_invoice_queries.py)
+# ----------------------------------------------------------------------
+
+TEST_DB = os.path.join(tempfile.mkdtemp(), 'queries.db')
+os.environ['DATABASE_URL'] = f'sqlite:///{TEST_DB}'
+
+from app import app, db, Client, Invoice, LineItem
+
+INVOICE_COUNTS = (1, 50, 200)
+LINE_ITEMS_PER_INVOICE = 3
+MAX_QUERIES = 4  # session user, ETag table versions, invoices (client joined), line items
+LIST_URLS = ('/api/invoices', '/api/invoices?view=summary', '/api/invoices?limit=100')
+
+
+def add_invoices(count):
+    """Adds `count` invoices with LINE_ITEMS_PER_INVOICE line items each."""
+    with app.app_context():
+        client_id = db.session.execute(db.select(Client.id).limit(1)).scalar()
+        if client_id is None:
+            client_id = db.session.execute(
+                Client.__table__.insert().values(name='Query Check', status='Active')
+            ).inserted_primary_key[0]
+        first = db.session.execute(db.select(db.func.count(Invoice.id))).scalar()
+        db.session.execute(Invoice.__table__.insert(), [
+            {'invoice_number': f'QC-{first + i}', 'client_id': client_id, 'issue_date': '2025-01-01',
+             'due_date': '2025-02-01', 'total_amount': '30.00', 'status': 'Draft'}
+            for i in range(count)
+        ])
+        new_ids = db.session.execute(db.select(Invoice.id).order_by(Invoice.id.desc()).limit(count)).scalars()
+        db.session.execute(LineItem.__table__.insert(), [
+            {'invoice_id': invoice_id, 'description': f'Item {n}', 'quantity': 1,
+             'unit_price': '10.00', 'subtotal': '10.00'}
+            for invoice_id in new_ids for n in range(LINE_ITEMS_PER_INVOICE)
+        ])
+        db.session.commit()
+
+
+def count_queries(test_client, url):
+    """Number of statements the request runs (background threads' queries are not counted)."""
+    statements = []
+    request_thread = threading.get_ident()
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if threading.get_ident() == request_thread:
+            statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        response = test_client.get(url)
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    assert response.status_code == 200, response.get_data(as_text=True)
+    return len(statements)
+
+
+def query_counts():
+    """{url: [query count at each of INVOICE_COUNTS]}"""
+    test_client = app.test_client()
+    login = test_client.post('/login', json={'username': 'admin', 'password': '12345'})
+    assert login.status_code == 200, "check needs the default admin user"
+
+    counts = {url: [] for url in LIST_URLS}
+    existing = 0
+    for total in INVOICE_COUNTS:
+        add_invoices(total - existing)
+        existing = total
+        for url in LIST_URLS:
+            counts[url].append(count_queries(test_client, url))
+    return counts
+
+
+def test_invoice_list_query_count_is_bounded():
+    for url, counts in query_counts().items():
+        assert len(set(counts)) == 1, f"{url}: query count grows with the number of invoices: {counts}"
+        assert counts[0] <= MAX_QUERIES, f"{url}: {counts[0]} queries (expected at most {MAX_QUERIES})"
+
+
+if __name__ == '__main__':
+    for url, counts in query_counts().items():
+        print(f"{url:<32} " + "   ".join(f"{n} invoices: {c} queries" for n, c in zip(INVOICE_COUNTS, counts)))
+    test_invoice_list_query_count_is_bounded()
+    print("OK")
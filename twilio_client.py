@@ -0,0 +1,267 @@
+import base64
+import hashlib
+import hmac
+import random
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+# ----------------------------------------------------------------------
+# TWILIO REST CLIENT
+# One TwilioClient per process: it keeps a pooled requests.Session, so every message
+# after the first reuses an open keep-alive TLS connection, and the credentials are
+# read once when the client is created. Its CircuitBreaker (which the broadcast sender
+# shares) stops calls altogether while Twilio is failing. This module has no Flask imports.
+# ----------------------------------------------------------------------
+
+TWILIO_API_BASE = "https://api.twilio.com/2010-04-01"
+
+
+class TwilioError(Exception):
+    """
+    A message Twilio did not accept. `retryable` is False when sending it again cannot
+    succeed (e.g. a 400 for an invalid number) or could deliver it twice (a read timeout);
+    `retry_after` is the delay in seconds Twilio asked for, if any.
+    """
+
+    def __init__(self, message, status_code=None, retryable=True, retry_after=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(TwilioError):
+    """Raised without contacting Twilio while the circuit breaker is open."""
+
+    def __init__(self, retry_after):
+        super().__init__("Twilio circuit breaker is open", retryable=True, retry_after=retry_after)
+
+
+class CircuitBreaker:
+    """
+    Stops calls to Twilio while it is failing. It trips (opens) when, among the last
+    `window` calls (and at least `min_calls`), the share of failures reaches failure_rate
+    or the share of calls slower than slow_call_seconds reaches slow_call_rate. After
+    open_seconds it half-opens and lets up to `probes` calls through: if they all succeed
+    it closes again, and the first failure re-opens it. Safe to share between threads.
+    """
+
+    def __init__(self, failure_rate=0.5, slow_call_seconds=5, slow_call_rate=0.5, window=20, min_calls=5,
+                 open_seconds=30, probes=3):
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.probes = probes
+
+        self.state = 'closed'  # closed, open, half_open
+        self.calls = deque(maxlen=window)  # (failed, slow) for the most recent calls
+        self.opened_at = None
+        self.probes_started = self.probes_succeeded = 0
+        self.trips = self.rejected = 0
+        self.last_trip_reason = None
+        self._lock = threading.Lock()
+
+    def _half_open_if_due(self, now):
+        if self.state == 'open' and now - self.opened_at >= self.open_seconds:
+            self.state = 'half_open'
+            self.probes_started = self.probes_succeeded = 0
+
+    def _trip(self, reason, now):
+        self.state = 'open'
+        self.opened_at = now
+        self.trips += 1
+        self.last_trip_reason = reason
+        self.calls.clear()
+
+    def available(self):
+        """True if a call would be let through right now (does not take a probe slot)."""
+        with self._lock:
+            self._half_open_if_due(time.monotonic())
+            return self.state == 'closed' or (self.state == 'half_open' and self.probes_started < self.probes)
+
+    def retry_after(self):
+        """Seconds until the breaker half-opens (0 unless it is open)."""
+        with self._lock:
+            if self.state != 'open':
+                return 0
+            return max(0.0, self.opened_at + self.open_seconds - time.monotonic())
+
+    def allow_request(self):
+        """Claims permission for one call; every allowed call must be followed by record()."""
+        with self._lock:
+            self._half_open_if_due(time.monotonic())
+            if self.state == 'closed':
+                return True
+            if self.state == 'half_open' and self.probes_started < self.probes:
+                self.probes_started += 1
+                return True
+            self.rejected += 1
+            return False
+
+    def record(self, failed, duration):
+        """Records the outcome of an allowed call that took `duration` seconds."""
+        slow = duration >= self.slow_call_seconds
+        with self._lock:
+            now = time.monotonic()
+            if self.state == 'half_open':
+                if failed or slow:
+                    self._trip('probe failed' if failed else 'probe slow', now)
+                else:
+                    self.probes_succeeded += 1
+                    if self.probes_succeeded >= self.probes:
+                        self.state = 'closed'
+                        self.opened_at = None
+                return
+            if self.state != 'closed':
+                return  # a call that started before the breaker opened
+
+            self.calls.append((failed, slow))
+            if len(self.calls) < self.min_calls:
+                return
+            failures = sum(1 for call_failed, _ in self.calls if call_failed)
+            slow_calls = sum(1 for _, call_slow in self.calls if call_slow)
+            if failures >= self.failure_rate * len(self.calls):
+                self._trip(f"{failures}/{len(self.calls)} calls failed", now)
+            elif slow_calls >= self.slow_call_rate * len(self.calls):
+                self._trip(f"{slow_calls}/{len(self.calls)} calls slower than {self.slow_call_seconds}s", now)
+
+    def stats(self):
+        with self._lock:
+            self._half_open_if_due(time.monotonic())
+            failures = sum(1 for failed, _ in self.calls if failed)
+            slow_calls = sum(1 for _, slow in self.calls if slow)
+            return {
+                'state': self.state,
+                'trips': self.trips,
+                'rejected': self.rejected,
+                'last_trip_reason': self.last_trip_reason,
+                'recent_calls': len(self.calls),
+                'recent_failure_rate': round(failures / len(self.calls), 3) if self.calls else None,
+                'recent_slow_call_rate': round(slow_calls / len(self.calls), 3) if self.calls else None,
+                'retry_after_seconds': (round(max(0.0, self.opened_at + self.open_seconds - time.monotonic()), 1)
+                                        if self.state == 'open' else 0),
+            }
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date), or None."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+def is_connect_failure(error):
+    """True if a requests.ConnectionError happened before a connection was made, so nothing was sent."""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+def twilio_signature(auth_token, url, params):
+    """
+    Expected X-Twilio-Signature for a request to `url` with POST `params` ((name, value)
+    pairs): base64 HMAC-SHA1 of the URL followed by every name and value, sorted by name.
+    """
+    data = url + ''.join(f"{name}{value}" for name, value in sorted(params))
+    digest = hmac.new(auth_token.encode('utf-8'), data.encode('utf-8'), hashlib.sha1).digest()
+    return base64.b64encode(digest).decode('ascii')
+
+
+class TwilioClient:
+    def __init__(self, account_sid, auth_token, sender, base_url=TWILIO_API_BASE, status_callback=None,
+                 timeout=(5, 30), max_retries=3, backoff=0.5, max_backoff=30, pool_size=10, breaker=None):
+        self.auth_token = auth_token
+        self.sender = sender
+        self.status_callback = status_callback  # URL Twilio posts delivery status updates to
+        self.messages_url = f"{base_url.rstrip('/')}/Accounts/{account_sid}/Messages.json"
+        self.timeout = timeout  # (connect, read) seconds
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker = breaker or CircuitBreaker()
+
+        self.session = requests.Session()
+        self.session.auth = (account_sid, auth_token)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def validate_signature(self, url, params, signature):
+        """True if `signature` (the X-Twilio-Signature header) is Twilio's for this request."""
+        return hmac.compare_digest(twilio_signature(self.auth_token, url, params), signature or '')
+
+    def backoff_delay(self, attempt):
+        """Exponential backoff with full jitter for the given retry attempt (0-based)."""
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def send_message(self, to, body, media_url=None):
+        """
+        Sends a WhatsApp message and returns Twilio's JSON response. Connection failures,
+        429s and 5xx responses are retried up to max_retries times, waiting as long as
+        Retry-After asks for when the response carries it. Raises TwilioError, or
+        CircuitOpenError without sending while the circuit breaker is open.
+        """
+        payload = {'To': to, 'From': self.sender, 'Body': body}
+        if media_url:
+            payload['MediaUrl'] = media_url
+        if self.status_callback:
+            payload['StatusCallback'] = self.status_callback
+
+        for attempt in range(self.max_retries + 1):
+            if not self.breaker.allow_request():
+                raise CircuitOpenError(self.breaker.retry_after())
+            started = time.monotonic()
+            try:
+                response = self.session.post(self.messages_url, data=payload, timeout=self.timeout)
+            except requests.ConnectionError as e:
+                self.breaker.record(True, time.monotonic() - started)
+                if not is_connect_failure(e):
+                    # The connection dropped after the request went out (e.g. RemoteDisconnected),
+                    # so Twilio may have accepted the message: never resend it automatically
+                    raise TwilioError(f"Network error, delivery unknown: {e}", retryable=False)
+                # The connection was never established, so Twilio never saw the request
+                error = TwilioError(f"Network error: {e}")
+                delay = self.backoff_delay(attempt)
+            except requests.RequestException as e:
+                # A read timeout may mean Twilio did accept the message, so it is never resent
+                # automatically; check the Twilio logs before sending it again by hand
+                self.breaker.record(True, time.monotonic() - started)
+                raise TwilioError(f"Network error, delivery unknown: {e}", retryable=False)
+            else:
+                # 4xx answers (bad numbers, rate limits) mean Twilio is up, so only 5xx count as failures
+                self.breaker.record(response.status_code >= 500, time.monotonic() - started)
+                if response.status_code in [200, 201]:
+                    return response.json()
+                retryable = response.status_code == 429 or response.status_code >= 500
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                error = TwilioError(f"Twilio API failed: {response.status_code}", response.status_code,
+                                    retryable=retryable, retry_after=retry_after)
+                if not retryable:
+                    print(f"Twilio Error Response: {response.text}")
+                    raise error
+                delay = retry_after if retry_after is not None else self.backoff_delay(attempt)
+
+            # Waits longer than max_backoff are left to the caller (e.g. the outbox schedule)
+            if attempt == self.max_retries or delay > self.max_backoff:
+                raise error
+            time.sleep(delay)
@@ -0,0 +1,132 @@
+import asyncio
+import random
+import time
+
+import aiohttp
+
+from twilio_client import TWILIO_API_BASE, CircuitOpenError, parse_retry_after
+
+# ----------------------------------------------------------------------
+# WHATSAPP BROADCAST SENDER
+# Fans a message out to many recipients concurrently over one aiohttp session, while a
+# token bucket keeps the send rate at the sender's Twilio throughput limit. Results are
+# reported per recipient through a callback; this module has no Flask or database imports.
+# ----------------------------------------------------------------------
+
+
+class TokenBucket:
+    """Allows `rate` acquisitions per second on average, with bursts of up to `capacity`."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds):
+        """Holds back every sender for `seconds` (e.g. when Twilio answers 429 with Retry-After)."""
+        self.tokens = min(self.tokens, -seconds * self.rate)
+
+
+class BroadcastSender:
+    def __init__(self, account_sid, auth_token, sender, base_url=TWILIO_API_BASE, status_callback=None,
+                 rate=80, concurrency=50, timeout=(5, 30), max_retries=3, backoff=0.5, breaker=None):
+        self.account_sid = account_sid
+        self.auth_token = auth_token
+        self.sender = sender
+        self.status_callback = status_callback
+        self.messages_url = f"{base_url.rstrip('/')}/Accounts/{account_sid}/Messages.json"
+        self.rate = rate  # messages per second
+        self.concurrency = concurrency
+        self.timeout = timeout  # (connect, read) seconds
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.breaker = breaker  # optional CircuitBreaker, usually shared with the TwilioClient
+
+    async def run(self, recipients, on_result, should_stop=None):
+        """
+        Sends to every (recipient id, to, body) in `recipients` and calls
+        on_result(recipient id, ok, message sid, error) as each one finishes. Recipients not
+        yet started when should_stop() returns True, or that the circuit breaker turned away,
+        are left alone (no result is reported).
+        """
+        bucket = TokenBucket(self.rate)
+        queue = asyncio.Queue()
+        for recipient in recipients:
+            queue.put_nowait(recipient)
+
+        connect_timeout, read_timeout = self.timeout
+        async with aiohttp.ClientSession(
+            auth=aiohttp.BasicAuth(self.account_sid, self.auth_token),
+            connector=aiohttp.TCPConnector(limit=self.concurrency),
+            timeout=aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout),
+        ) as session:
+            workers = [asyncio.create_task(self._worker(session, bucket, queue, on_result, should_stop))
+                       for _ in range(min(self.concurrency, queue.qsize()))]
+            await asyncio.gather(*workers)
+
+    async def _worker(self, session, bucket, queue, on_result, should_stop):
+        while not queue.empty():
+            if should_stop and should_stop():
+                return
+            recipient_id, to, body = queue.get_nowait()
+            try:
+                ok, sid, error = await self._send(session, bucket, to, body)
+            except CircuitOpenError:
+                return
+            on_result(recipient_id, ok, sid, error)
+
+    async def _send(self, session, bucket, to, body):
+        """
+        Returns (ok, message sid, error) for one recipient, retrying 429s, 5xx and failed
+        connects. Raises CircuitOpenError if the circuit breaker refuses an attempt.
+        """
+        payload = {'To': to, 'From': self.sender, 'Body': body}
+        if self.status_callback:
+            payload['StatusCallback'] = self.status_callback
+        for attempt in range(self.max_retries + 1):
+            await bucket.acquire()
+            if self.breaker and not self.breaker.allow_request():
+                raise CircuitOpenError(self.breaker.retry_after())
+            started = time.monotonic()
+            status = retry_after = None
+            try:
+                async with session.post(self.messages_url, data=payload) as response:
+                    status = response.status
+                    self._record(status >= 500, started)
+                    if response.status in (200, 201):
+                        return True, (await response.json()).get('sid'), None
+                    error = f"Twilio API failed: {response.status}"
+                    retryable = response.status == 429 or response.status >= 500
+                    retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            except aiohttp.ClientConnectorError as e:
+                # Never reached Twilio, so resending cannot duplicate the message
+                self._record(True, started)
+                error, retryable = f"Network error: {e}", True
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if status is None:  # otherwise the outcome was already recorded
+                    self._record(True, started)
+                error, retryable = f"Network error: {e!r}", False
+
+            if not retryable or attempt == self.max_retries:
+                return False, None, error
+            if retry_after is not None:
+                bucket.pause(retry_after)
+            else:
+                await asyncio.sleep(random.uniform(0, self.backoff * 2 ** attempt))
+
+    def _record(self, failed, started):
+        if self.breaker:
+            self.breaker.record(failed, time.monotonic() - started)